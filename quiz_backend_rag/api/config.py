@@ -4,3 +4,100 @@ USE_OPENAI = os.getenv("USE_OPENAI", "false").lower() in ("1","true","yes")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 PHI3_MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "ml_model", "Phi-3-mini-128k-instruct.Q4_K_M.gguf")
 
+# Ingestion: number of chunks encoded per SentenceTransformer.encode call
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+
+# Background ingestion of uploaded lecture notes
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "16"))
+INGEST_MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", "2"))
+# Unfinished jobs of another host with no update for this long count as dead
+INGEST_STALE_AFTER_SECS = int(os.getenv("INGEST_STALE_AFTER_SECS", "3600"))
+
+# PDF text extraction: process pool size and pages per shard
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_SHARD = int(os.getenv("PDF_PAGES_PER_SHARD", "25"))
+
+# Chunking: token budget per chunk (0 = encoder max sequence length) and overlap
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "0"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+
+# Embedding backfill for chunks stored without vectors
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "512"))
+
+# Keywords stored per chunk (TF-IDF over the note's chunks)
+KEYWORDS_PER_CHUNK = int(os.getenv("KEYWORDS_PER_CHUNK", "8"))
+
+# Sentence embedding model (loaded lazily on first use)
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+# Load the embedding model in the background at API startup
+EMBEDDING_WARMUP = os.getenv("EMBEDDING_WARMUP", "false").lower() in ("1","true","yes")
+
+# Query embedding cache: in-memory LRU entries and optional on-disk tier (sqlite file, "" = off)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH", "")
+
+# Chunk embedding storage format: float32 (legacy raw bytes), float16 or int8
+EMBEDDING_STORAGE_DTYPES = ("float32", "float16", "int8")
+EMBEDDING_STORAGE_DTYPE = os.getenv("EMBEDDING_STORAGE_DTYPE", "float32")
+
+# Per-lecture-note vector index cache (embedding matrices kept in their storage dtype)
+VECTOR_CACHE_MAX_MB = int(os.getenv("VECTOR_CACHE_MAX_MB", "256"))
+# Check a cheap chunk-count signature on every hit so writes made by other
+# worker processes are noticed (explicit invalidation only covers this process)
+VECTOR_CACHE_VALIDATE = os.getenv("VECTOR_CACHE_VALIDATE", "true").lower() in ("1","true","yes")
+
+# Course-wide approximate nearest-neighbour (IVF) indexes
+ANN_INDEX_DIR = os.getenv("ANN_INDEX_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "vector_index"))
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "16"))
+# Below this many vectors the index keeps a single list (exact search)
+ANN_MIN_TRAIN_SIZE = int(os.getenv("ANN_MIN_TRAIN_SIZE", "2048"))
+
+# Where chunk vectors live: "mysql" (Chunk.embedding LONGBLOB) or "mmap" (local .npy files)
+VECTOR_STORES = ("mysql", "mmap")
+VECTOR_STORE = os.getenv("VECTOR_STORE", "mysql")
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "vector_store"))
+
+# Lexical (BM25) retrieval: per-note inverted indexes and default search mode
+BM25_INDEX_DIR = os.getenv("BM25_INDEX_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "bm25_index"))
+SEARCH_MODES = ("vector", "bm25", "hybrid")
+SEARCH_MODE = os.getenv("SEARCH_MODE", "vector")
+
+# Batch search: maximum queries per POST /search/{id}/batch request
+SEARCH_BATCH_MAX_QUERIES = int(os.getenv("SEARCH_BATCH_MAX_QUERIES", "64"))
+
+# Phi-3 instances, each running on its own slice of the cores
+# (threads per instance: 0 = cores / instances)
+LLM_INSTANCES = int(os.getenv("LLM_INSTANCES", "1"))
+LLM_THREADS_PER_INSTANCE = int(os.getenv("LLM_THREADS_PER_INSTANCE", "0"))
+LLM_PIN_CORES = os.getenv("LLM_PIN_CORES", "true").lower() in ("1","true","yes")
+
+# LLM inference pool: concurrent generation calls, and requests admitted to wait beyond them.
+# Defaults to the instances the pool really starts (at most one per available core)
+_LLM_CORES = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", str(max(1, min(LLM_INSTANCES, _LLM_CORES)))))
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "8"))
+
+# Questions requested per Phi-3 call (one prompt prefill serves several MCQs)
+MCQ_PER_CALL = int(os.getenv("MCQ_PER_CALL", "3"))
+
+# KV states kept for repeated prompt prefixes (system block + chunk), in total
+# across all LLM instances; 0 disables
+LLM_PREFIX_CACHE_MB = int(os.getenv("LLM_PREFIX_CACHE_MB", "1024"))
+
+# Constrain Phi-3 sampling to the MCQ JSON shape with a GBNF grammar
+MCQ_GRAMMAR = os.getenv("MCQ_GRAMMAR", "true").lower() in ("1","true","yes")
+
+
+def check_settings():
+    """Reject invalid settings at startup instead of failing on every request."""
+    if ANN_NPROBE < 1:
+        raise ValueError(f"ANN_NPROBE must be >= 1, got {ANN_NPROBE}")
+    if SEARCH_MODE not in SEARCH_MODES:
+        raise ValueError(f"SEARCH_MODE must be one of {', '.join(SEARCH_MODES)}, got {SEARCH_MODE!r}")
+    if EMBEDDING_STORAGE_DTYPE not in EMBEDDING_STORAGE_DTYPES:
+        raise ValueError(
+            f"EMBEDDING_STORAGE_DTYPE must be one of {', '.join(EMBEDDING_STORAGE_DTYPES)}, got {EMBEDDING_STORAGE_DTYPE!r}"
+        )
+    if VECTOR_STORE not in VECTOR_STORES:
+        raise ValueError(f"VECTOR_STORE must be one of {', '.join(VECTOR_STORES)}, got {VECTOR_STORE!r}")
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
 
@@ -19,3 +19,20 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def add_missing_columns(table) -> list[str]:
+    """
+    ALTER an existing table to add nullable columns that were added to its
+    model later (create_all only creates missing tables).
+    Returns the names of the columns added.
+    """
+    existing = {c["name"] for c in inspect(engine).get_columns(table.name)}
+    added = []
+    with engine.begin() as conn:
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            ddl = column.type.compile(dialect=engine.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {ddl} NULL"))
+            added.append(column.name)
+    return added
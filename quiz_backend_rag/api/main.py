@@ -1,6 +1,10 @@
 from fastapi import FastAPI
-from api.routers import teachers_router, students_router,retrieval_records_router , courses_router, teaches_router, enrollments_router, lecture_notes_router, quizzes_router, quiz_questions_router, assignments_router, attempts_router, search_router, auth_router, question_library_router
+from api.routers import teachers_router, students_router,retrieval_records_router , courses_router, teaches_router, enrollments_router, lecture_notes_router, quizzes_router, quiz_questions_router, assignments_router, attempts_router, search_router, auth_router, question_library_router, embeddings_router
 import api.database as database
+from api.config import EMBEDDING_WARMUP, check_settings
+from api.utils import embedding_utils
+from api.services import ingest_jobs
+from api.models.lecture_notes import LectureNote
 
 app = FastAPI(title="Quiz Generation & Assessment API")
 
@@ -19,9 +23,17 @@ app.include_router(attempts_router.router)
 app.include_router(question_library_router.router) # Added question_library_router
 app.include_router(retrieval_records_router.router)
 app.include_router(search_router.router)
+app.include_router(embeddings_router.router)
 
 
 # create tables if needed (optional)
 @app.on_event("startup")
 def startup_event():
+    check_settings()
     database.Base.metadata.create_all(bind=database.engine)
+    if "ingested_at" in database.add_missing_columns(LectureNote.__table__):
+        ingest_jobs.mark_existing_notes_ingested()
+    # Jobs a stopped worker left half done would otherwise stay "active" forever
+    ingest_jobs.recover_interrupted_jobs()
+    if EMBEDDING_WARMUP:
+        embedding_utils.start_warm_up()
@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Integer, String, Text, Float, Boolean, JSON, TIMESTAMP, ForeignKey
+from api.database import Base
+
+
+class IngestJob(Base):
+    __tablename__ = "ingest_jobs"
+
+    # Latest ingestion job of each lecture note
+    lecture_note_id = Column(
+        Integer,
+        ForeignKey("lecture_notes.id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    job_id = Column(String(36), nullable=False)
+
+    # queued | extracting | embedding | retrying | done | failed
+    stage = Column(String(20), nullable=False)
+    progress = Column(Float, default=0.0)
+    attempt = Column(Integer, default=0)
+    chunks_created = Column(Integer, default=0)
+    embeddings_created = Column(Integer, default=0)
+    incremental = Column(Boolean, default=False)
+    # PDF being ingested; for replacements (incremental) the note switches
+    # to it, and to new_name, only once the job succeeds
+    file_path = Column(String(500), nullable=True)
+    new_name = Column(String(255), nullable=True)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+
+    # Process running the job ("host:pid"), to recover jobs it left behind
+    owner = Column(String(255), nullable=True)
+
+    created_at = Column(TIMESTAMP, nullable=False)
+    updated_at = Column(TIMESTAMP, nullable=False)
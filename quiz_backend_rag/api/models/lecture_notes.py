@@ -11,4 +11,6 @@ class LectureNote(Base):
     file_path = Column(String(500), nullable=False)
     original_name = Column(String(255), nullable=True)
     uploaded_at = Column(TIMESTAMP, nullable=True)
+    # Set when an ingestion job finished: the chunk set is complete (safe to clone)
+    ingested_at = Column(TIMESTAMP, nullable=True)
     chunks = relationship("Chunk", back_populates="lecture_notes")
\ No newline at end of file
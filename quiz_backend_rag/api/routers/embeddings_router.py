@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
+from api.database import get_db
+from api.services.backfill_service import backfill_embeddings
+from api.utils import embedding_utils
+from api.config import EMBEDDING_MODEL_NAME, EMBEDDING_WARMUP
+
+router = APIRouter(prefix="/embeddings", tags=["Embeddings"])
+
+@router.post("/backfill")
+def backfill(
+    course_id: int | None = None,
+    after_id: int = 0,
+    max_batches: int = Query(10, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    """
+    Embed chunks stored without vectors. Processes up to max_batches
+    batches per call; repeat with after_id=last_id until done is true.
+    """
+    return backfill_embeddings(db, course_id=course_id, after_id=after_id, max_batches=max_batches)
+
+@router.get("/ready")
+def ready():
+    """
+    Readiness of the embedding model.
+    Returns 503 while a startup warm-up is still loading (or failed);
+    without warm-up the model loads on first use and this reports 200.
+    """
+    loaded = embedding_utils.is_model_loaded()
+    error = embedding_utils.model_load_error()
+    body = {
+        "model": EMBEDDING_MODEL_NAME,
+        "loaded": loaded,
+        "warmup_enabled": EMBEDDING_WARMUP,
+        "error": error,
+    }
+    if loaded or (not EMBEDDING_WARMUP and not error):
+        return body
+    return JSONResponse(status_code=503, content=body)
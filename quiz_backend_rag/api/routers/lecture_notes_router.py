@@ -1,12 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks
 from sqlalchemy.orm import Session
-from api.database import get_db
+from api.database import get_db, SessionLocal
 from api.models.lecture_notes import LectureNote
-from api.schemas.lecture_notes_schema import LectureNoteCreate, LectureNoteOut
-from api.services import ingest_service
-import shutil
+from api.schemas.lecture_notes_schema import LectureNoteCreate, LectureNoteOut, IngestStatusOut
+from api.services import ingest_jobs, ingest_service, vector_index_cache, ann_index, bm25_index
+from api.services.vector_store import get_vector_store
+from datetime import datetime
 import os
-import uuid
 
 router = APIRouter(prefix="/lecture-notes", tags=["LectureNotes"])
 
@@ -19,17 +19,11 @@ def create_note(
 ):
     # 1. Setup paths
     upload_dir = "PDF"
-    os.makedirs(upload_dir, exist_ok=True)
-    
-    # Generate unique filename to facilitate storage
     file_ext = os.path.splitext(file.filename)[1]
-    unique_filename = f"{uuid.uuid4()}{file_ext}"
-    file_path = os.path.join(upload_dir, unique_filename)
     
-    # 2. Save file to disk
+    # 2. Save file to disk (content-addressed: identical uploads share one file)
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        file_path, is_new_file = ingest_service.save_upload_hashed(file.file, upload_dir, file_ext)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {e}")
 
@@ -44,31 +38,109 @@ def create_note(
         db.add(note)
         db.commit()
         db.refresh(note)
+    except Exception as e:
+        db.rollback()
+        if is_new_file and os.path.exists(file_path):
+            os.remove(file_path)
+        raise HTTPException(status_code=500, detail=f"Failed to create lecture note: {e}")
+
+    # Duplicate upload: copy the chunks and embeddings of an already ingested note
+    if not is_new_file:
+        source = _find_ingested_note(db, file_path, exclude_id=note.id)
+        if source:
+            try:
+                chunks_count, embeddings_count = ingest_service.clone_chunks(db, source.id, note.id)
+                note.ingested_at = datetime.utcnow()
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                db.delete(note); db.commit()
+                raise HTTPException(status_code=500, detail=f"Failed to copy chunks: {e}")
+            return {
+                "id": note.id,
+                "chunks_created": chunks_count,
+                "embeddings_created": embeddings_count,
+                "duplicate_of": source.id,
+                "status": "processed"
+            }
+
+    # 4. Ingest in the background: Text Extraction & Chunking & Embedding
+    try:
+        job_id = ingest_jobs.submit(note.id, file_path)
+    except ingest_jobs.IngestQueueFull as e:
+        db.delete(note); db.commit()
+        if is_new_file and os.path.exists(file_path):
+            os.remove(file_path)
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return {
+        "id": note.id,
+        "job_id": job_id,
+        "status": "queued"
+    }
 
-        # 4. Ingest: Text Extraction & Chunking & Embedding
-        # Extract
-        text = ingest_service.extract_text_from_pdf(file_path)
-        
-        # Process (Chunk + Embed + Save)
-        chunks_count, embeddings_count = ingest_service.process_and_store_chunks(db, note.id, text)
+def _find_ingested_note(db: Session, file_path: str, exclude_id: int):
+    """
+    Latest note stored at file_path whose ingestion has finished and produced
+    chunks. Only notes with the completion marker qualify, so a note still
+    ingesting in another worker (or left partial by a crash) is never cloned.
+    """
+    return (
+        db.query(LectureNote)
+        .filter(
+            LectureNote.file_path == file_path,
+            LectureNote.id != exclude_id,
+            LectureNote.ingested_at.isnot(None),
+            LectureNote.chunks.any(),
+        )
+        .order_by(LectureNote.id.desc())
+        .first()
+    )
+
+@router.get("/{note_id}/ingest-status", response_model=IngestStatusOut)
+def ingest_status(note_id: int):
+    status = ingest_jobs.get_status(note_id)
+    if not status:
+        raise HTTPException(404, "No ingestion job found for this note")
+    return status
 
-        return {
-            "id": note.id,
-            "chunks_created": chunks_count,
-            "embeddings_created": embeddings_count,
-            "status": "processed"
-        }
+@router.put("/{note_id}/file")
+def replace_note_file(
+    note_id: int,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db)
+):
+    """
+    Replace the PDF of an existing note and re-ingest incrementally:
+    only new or changed chunks are embedded, unchanged chunk ids are kept.
+    """
+    note = db.query(LectureNote).get(note_id)
+    if not note:
+        raise HTTPException(404, "Note not found")
+    # Cheap early answer; submit() below makes the authoritative, atomic claim
+    if ingest_jobs.is_active(note_id):
+        raise HTTPException(409, "Ingestion already in progress for this note")
 
+    file_ext = os.path.splitext(file.filename)[1]
+    try:
+        file_path, is_new_file = ingest_service.save_upload_hashed(file.file, "PDF", file_ext)
     except Exception as e:
-        db.rollback()
-        # Clean up file if DB failed (optional but good practice)
-        if os.path.exists(file_path):
+        raise HTTPException(status_code=500, detail=f"Failed to save file: {e}")
+
+    # The note keeps its current file until the job succeeds (see ingest_jobs.submit)
+    try:
+        job_id = ingest_jobs.submit(note.id, file_path, incremental=True, original_name=file.filename)
+    except (ingest_jobs.IngestQueueFull, ingest_jobs.IngestJobActive) as e:
+        if is_new_file and not ingest_jobs.file_in_use(db, file_path):
             os.remove(file_path)
-        return {
-            "status": "failed",
-            "error": str(e),
-            "chunks_created": 0
-        }
+        status = 409 if isinstance(e, ingest_jobs.IngestJobActive) else 503
+        raise HTTPException(status_code=status, detail=str(e))
+
+    return {
+        "id": note.id,
+        "job_id": job_id,
+        "status": "queued"
+    }
 
 @router.get("/", response_model=list[LectureNoteOut])
 def list_notes(db: Session = Depends(get_db)):
@@ -85,10 +157,24 @@ def get_note(note_id: int, db: Session = Depends(get_db)):
 def notes_by_course(course_id: int, db: Session = Depends(get_db)):
     return db.query(LectureNote).filter(LectureNote.course_id==course_id).all()
 
+def _refresh_course_index(note_id: int, course_id: int):
+    """Drop a deleted note from its course ANN index (runs after the response)."""
+    db = SessionLocal()
+    try:
+        ann_index.refresh_note(db, note_id, course_id=course_id)
+    finally:
+        db.close()
+
 @router.delete("/{note_id}")
-def delete_note(note_id: int, db: Session = Depends(get_db)):
+def delete_note(note_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     n = db.query(LectureNote).get(note_id)
     if not n:
         raise HTTPException(404, "Note not found")
+    course_id = n.course_id
     db.delete(n); db.commit()
+    get_vector_store().remove(note_id)
+    vector_index_cache.invalidate(note_id)
+    bm25_index.remove_note(note_id)
+    # Rewriting the course index is O(course size): keep it off the request path
+    background_tasks.add_task(_refresh_course_index, note_id, course_id)
     return {"detail":"deleted"}
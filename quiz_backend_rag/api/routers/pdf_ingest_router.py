@@ -79,7 +79,7 @@ from sqlalchemy.orm import Session
 from api.database import get_db
 from api.models.lecture_notes import LectureNote
 from api.models.chunks import Chunk
-from pypdf import PdfReader
+from api.services import ingest_service, vector_index_cache, ann_index, bm25_index
 import re
 import os
 
@@ -123,22 +123,8 @@ def clean_text(raw: str) -> str:
 #  CHUNKING LOGIC
 # -----------------------------------------------------
 
-def split_into_chunks(text: str, max_length: int = 1000):
-    """Split cleaned text into chunks of approx max_length chars."""
-    words = text.split()
-    chunks = []
-    current = []
-
-    for w in words:
-        if sum(len(x) + 1 for x in current) + len(w) > max_length:
-            chunks.append(" ".join(current))
-            current = []
-        current.append(w)
-
-    if current:
-        chunks.append(" ".join(current))
-
-    return chunks
+# Token-budget, sentence-aligned chunker shared with the upload pipeline
+split_into_chunks = ingest_service.split_into_chunks
 
 
 # -----------------------------------------------------
@@ -155,13 +141,9 @@ def process_pdf(lecture_note_id: int, db: Session = Depends(get_db)):
     if not os.path.exists(note.file_path):
         raise HTTPException(400, "PDF file does not exist on server")
 
-    # 2️⃣ Read PDF
+    # 2️⃣ Read PDF (parallel page-range extraction)
     try:
-        pdf = PdfReader(note.file_path)
-        extracted_text = ""
-
-        for page in pdf.pages:
-            extracted_text += page.extract_text() + "\n"
+        extracted_text = ingest_service.extract_text_from_pdf(note.file_path)
 
         if not extracted_text.strip():
             raise HTTPException(400, "No extractable text in PDF")
@@ -187,6 +169,10 @@ def process_pdf(lecture_note_id: int, db: Session = Depends(get_db)):
             db.add(chunk)
 
         db.commit()
+        vector_index_cache.invalidate(lecture_note_id)
+        ann_index.refresh_note(db, lecture_note_id)
+        bm25_index.build_note_index(db, lecture_note_id)
+        ingest_service.update_note_keywords(db, lecture_note_id)
 
         return {
             "lecture_note_id": lecture_note_id,
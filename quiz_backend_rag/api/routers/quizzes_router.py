@@ -1,10 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
 from api.database import get_db
 from api.models.quizzes import Quiz
 from api.schemas.quizzes_schema import QuizCreate, QuizOut, QuizUpdate, QuizGenerateRequest
 from api.schemas.quiz_gen_schema import QuizFinalizeRequest, MCQOut
-from api.services.quiz_generation_service import generate_quiz, generate_questions_preview, finalize_quiz
+from api.services.quiz_generation_service import generate_quiz, generate_questions_preview, finalize_quiz, prepare_preview, iter_preview_events
+from api.services import llm_executor
+from api.services.mcq_generator import prompt_cache_stats, generation_stats, pool_stats
+import json
 
 router = APIRouter(prefix="/quizzes", tags=["Quizzes"])
 
@@ -30,15 +37,18 @@ async def generate_quiz_endpoint(
     - Generate MCQs
     - Save Quiz & Questions to DB
     """
-    result = await generate_quiz(
-        db=db,
-        lecture_note_id=payload.lecture_note_id,
-        topic=payload.topic,
-        difficulty=payload.difficulty,
-        num_questions=payload.num_questions,
-        difficulty_dict=payload.difficulty_dict,
-        selected_library_question_ids=payload.selected_library_question_ids
-    )
+    try:
+        result = await generate_quiz(
+            db=db,
+            lecture_note_id=payload.lecture_note_id,
+            topic=payload.topic,
+            difficulty=payload.difficulty,
+            num_questions=payload.num_questions,
+            difficulty_dict=payload.difficulty_dict,
+            selected_library_question_ids=payload.selected_library_question_ids
+        )
+    except llm_executor.LLMQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
     return result
 
 @router.post("/generate-preview", response_model=list[MCQOut])
@@ -49,7 +59,33 @@ async def generate_quiz_preview_endpoint(
     """
     Generates questions for preview (no saving).
     """
-    result = await generate_questions_preview(
+    try:
+        result = await generate_questions_preview(
+            db=db,
+            lecture_note_id=payload.lecture_note_id,
+            topic=payload.topic,
+            difficulty=payload.difficulty,
+            num_questions=payload.num_questions,
+            difficulty_dict=payload.difficulty_dict,
+            selected_library_question_ids=payload.selected_library_question_ids
+        )
+    except llm_executor.LLMQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
+    return result
+
+@router.post("/generate-preview/stream")
+async def generate_quiz_preview_stream_endpoint(
+    payload: QuizGenerateRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Streaming variant of /generate-preview: newline-delimited JSON events,
+    each validated MCQ sent as soon as it is generated (see
+    iter_preview_events), ending with a "done" summary or an "error" event.
+    A saturated LLM pool is answered with 503 before the stream starts.
+    """
+    plan = await run_in_threadpool(
+        prepare_preview,
         db=db,
         lecture_note_id=payload.lecture_note_id,
         topic=payload.topic,
@@ -58,7 +94,58 @@ async def generate_quiz_preview_endpoint(
         difficulty_dict=payload.difficulty_dict,
         selected_library_question_ids=payload.selected_library_question_ids
     )
-    return result
+
+    # Admit before the 200 starts, so a saturated pool is a plain 503
+    try:
+        llm = llm_executor.admit()
+    except llm_executor.LLMQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
+
+    async def ndjson():
+        # The 200 status is already sent: every failure must end the stream with an error event
+        sent = 0
+        skipped = {"library": 0, "generated": 0}
+        try:
+            # First model call asks for a single MCQ so it arrives in seconds
+            async for event in iter_preview_events(plan, first_call_count=1, llm=llm):
+                if event["event"] == "question":
+                    try:
+                        event["question"] = MCQOut(**event["question"]).dict()
+                    except ValidationError:
+                        # e.g. a malformed library question: skip it, keep streaming
+                        skipped[event["source"]] += 1
+                        continue
+                    sent += 1
+                    event["index"] = sent
+                elif event["event"] == "done":
+                    # Summarize what the client actually received
+                    event["questions"] = sent
+                    event["generated"] -= skipped["generated"]
+                    event["skipped"] = skipped["library"] + skipped["generated"]
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            print(f"Preview stream failed: {e!r}")
+            yield json.dumps({"event": "error", "status": 500, "detail": f"Question generation failed: {e}"}) + "\n"
+        finally:
+            llm.release()
+
+    # The background task also releases the slot if the stream never starts
+    return StreamingResponse(
+        ndjson(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(llm.release),
+    )
+
+@router.get("/generation-queue")
+def generation_queue_stats():
+    """LLM queue depth and wait times, model instances, KV prefix cache hits and JSON validity."""
+    return {
+        **llm_executor.queue_stats(),
+        "model_pool": pool_stats(),
+        "prompt_cache": prompt_cache_stats(),
+        "generation": generation_stats(),
+    }
 
 @router.post("/finalize")
 def finalize_quiz_endpoint(
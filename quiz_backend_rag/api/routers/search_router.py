@@ -2,12 +2,64 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from api.database import get_db
 from api.models.lecture_notes import LectureNote
-from api.schemas.search_schema import SearchQuery
-from api.services.search_service import search_lecture_chunks, cosine_similarity, bytes_to_vector, generate_embedding
+from api.schemas.search_schema import SearchQuery, CourseSearchQuery, BatchSearchQuery
+from api.models.courses import Course
+from api.models.chunks import Chunk
+from api.services.search_service import search_lecture_chunks_scored, search_lecture_chunks_batch, load_chunks_by_ids
+from api.services import ann_index
+from api.config import ANN_NPROBE, SEARCH_BATCH_MAX_QUERIES
 import numpy as np
+from api.services import vector_index_cache
+from api.utils.query_cache import cache_stats, embed_query
 
 router = APIRouter(prefix="/search", tags=["Vector Search"])
 
+@router.get("/cache-stats")
+def query_cache_stats():
+    """Hit/miss counters of the query embedding and vector index caches."""
+    return {
+        "query_embeddings": cache_stats(),
+        "vector_index": vector_index_cache.cache_stats(),
+    }
+
+@router.post("/course/{course_id}")
+def search_course_chunks(
+    course_id: int,
+    payload: CourseSearchQuery,
+    db: Session = Depends(get_db),
+):
+    """Approximate (IVF) semantic search across every lecture note of a course."""
+    course = db.query(Course).get(course_id)
+    if not course:
+        raise HTTPException(404, "Course not found")
+
+    query_bytes = embed_query(payload.query)
+    if not query_bytes:
+        return {"query": payload.query, "results": []}
+
+    chunk_ids, scores = ann_index.search_course(
+        db, course_id, np.frombuffer(query_bytes, dtype=np.float32),
+        top_k=payload.top_k, nprobe=payload.nprobe or ANN_NPROBE,
+    )
+    chunk_map = load_chunks_by_ids(db, chunk_ids)
+
+    return {
+        "query": payload.query,
+        "results": [
+            {
+                "chunk_id": chunk.id,
+                "lecture_note_id": chunk.lecture_notes_id,
+                "chunk_index": chunk.chunk_index,
+                "text": chunk.text,
+                "similarity": float(sim)
+            }
+            for chunk, sim in (
+                (chunk_map.get(int(cid)), sim) for cid, sim in zip(chunk_ids, scores)
+            )
+            if chunk is not None
+        ]
+    }
+
 @router.post("/{lecture_note_id}")
 def search_chunks(
     lecture_note_id: int,
@@ -19,61 +71,66 @@ def search_chunks(
     if not note:
         raise HTTPException(404, "Lecture note not found")
 
-    # 2. Use Service for search
-    # Note: search_service currently returns just chunks.
-    # The original router calculated valid similarities to return to the user.
-    # If we want to return the exact similarity score, we might need the service to return it too.
-    # But for now, let's keep it simple or update service?
-    # Actually, the user requirement for THIS task is just to "Modify (minimally): Vector search service (to export top-k search function)"
-    # The Router needs to return results.
-    
-    # RE-IMPLEMENTING locally calling the service logic to get similarities if needed or just reproducing the flow
-    # using the service helpers functions to avoid code duplication in logic but maybe duplicating the loop if I need custom return format?
-    # The search_service.search_lecture_chunks returns List[Chunk]. It swallows the similarity score.
-    # The original router returns "similarity": float(sim).
-    
-    # Let's adjust the router to use the helper functions from service for match.
-    # OR better, let's update search_service to return (chunk, score) tuples?
-    # The user said "Retrieve top 6 chunks" for the quiz.
-    # For the search router, it returns a list of results with scores.
-    
-    # I'll use the low-level helpers from the service to maintain exact behavior here without changing the service signature 
-    # (which I designed for the Quiz usage primarily).
-    # actually, let's just use the service but duplicate the loop here using the service's helpers? 
-    # reusing "bytes_to_vector", "cosine_similarity" is good.
-    
-    # Fetch chunks
-    # (Leaving original logic mostly intact but using imported helpers to satisfy "Refactor")
-    from api.models.chunks import Chunk
-    chunks = db.query(Chunk).filter(
-        Chunk.lecture_notes_id == lecture_note_id
-    ).all()
+    # 2. Search (same code path as quiz generation); similarity is the mode's score
+    scored = search_lecture_chunks_scored(
+        db, lecture_note_id, payload.query, top_k=payload.top_k, mode=payload.mode
+    )
 
-    if not chunks:
+    if not scored and not db.query(Chunk.id).filter(Chunk.lecture_notes_id == lecture_note_id).first():
         raise HTTPException(400, "No chunks found. Process PDF first.")
 
-    query_vec = generate_embedding(payload.query)
-    query_vec = np.frombuffer(query_vec, dtype=np.float32)
-
-    similarities = []
+    return {
+        "query": payload.query,
+        "mode": payload.mode,
+        "results": [
+            {
+                "chunk_id": chunk.id,
+                "chunk_index": chunk.chunk_index,
+                "text": chunk.text,
+                "similarity": sim
+            }
+            for chunk, sim in scored
+        ]
+    }
 
-    for chunk in chunks:
-        if not chunk.embedding:
-            continue
+@router.post("/{lecture_note_id}/batch")
+def search_chunks_batch(
+    lecture_note_id: int,
+    payload: BatchSearchQuery,
+    db: Session = Depends(get_db),
+):
+    """Top-k chunks for several queries (e.g. one per quiz topic) in one request."""
+    if not payload.queries:
+        raise HTTPException(400, "No queries given")
+    if len(payload.queries) > SEARCH_BATCH_MAX_QUERIES:
+        raise HTTPException(400, f"At most {SEARCH_BATCH_MAX_QUERIES} queries per request")
 
-        chunk_vec = bytes_to_vector(chunk.embedding)
-        sim = cosine_similarity(query_vec, chunk_vec)
+    note = db.query(LectureNote).get(lecture_note_id)
+    if not note:
+        raise HTTPException(404, "Lecture note not found")
 
-        similarities.append({
-            "chunk_id": chunk.id,
-            "chunk_index": chunk.chunk_index,
-            "text": chunk.text,
-            "similarity": float(sim)
-        })
+    if not db.query(Chunk.id).filter(Chunk.lecture_notes_id == lecture_note_id).first():
+        raise HTTPException(400, "No chunks found. Process PDF first.")
 
-    similarities.sort(key=lambda x: x["similarity"], reverse=True)
+    batches = search_lecture_chunks_batch(
+        db, lecture_note_id, payload.queries, top_k=payload.top_k, mode=payload.mode
+    )
 
     return {
-        "query": payload.query,
-        "results": similarities[:payload.top_k]
+        "mode": payload.mode,
+        "results": [
+            {
+                "query": query,
+                "results": [
+                    {
+                        "chunk_id": chunk.id,
+                        "chunk_index": chunk.chunk_index,
+                        "text": chunk.text,
+                        "similarity": sim
+                    }
+                    for chunk, sim in scored
+                ]
+            }
+            for query, scored in zip(payload.queries, batches)
+        ]
     }
@@ -15,3 +15,18 @@ class LectureNoteOut(LectureNoteBase):
     uploaded_at: str | None = None
     class Config:
         orm_mode = True
+
+
+class IngestStatusOut(BaseModel):
+    job_id: str
+    lecture_note_id: int
+    stage: str  # queued | extracting | embedding | retrying | done | failed
+    progress: float
+    attempt: int
+    chunks_created: int = 0
+    embeddings_created: int = 0
+    incremental: bool = False
+    result: dict | None = None
+    error: str | None = None
+    created_at: str
+    updated_at: str
@@ -1,5 +1,18 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import Literal
+from api.config import SEARCH_MODE
 
-class SearchQuery(BaseModel):
+class SearchQueryBase(BaseModel):
     query: str
     top_k: int = 5
+
+class SearchQuery(SearchQueryBase):
+    mode: Literal["vector", "bm25", "hybrid"] = SEARCH_MODE
+
+class CourseSearchQuery(SearchQueryBase):  # course search is vector-only (IVF index)
+    nprobe: int | None = Field(None, ge=1)  # IVF lists to scan (defaults to ANN_NPROBE)
+
+class BatchSearchQuery(BaseModel):
+    queries: list[str]
+    top_k: int = 5
+    mode: Literal["vector", "bm25", "hybrid"] = SEARCH_MODE
@@ -0,0 +1,282 @@
+from sqlalchemy.orm import Session
+from api.models.lecture_notes import LectureNote
+from api.services.vector_store import get_vector_store
+from api.utils.vector_codec import normalize_rows
+from api.config import ANN_INDEX_DIR, ANN_NPROBE, ANN_MIN_TRAIN_SIZE
+import numpy as np
+import threading
+import uuid
+import os
+
+# Course-wide approximate nearest-neighbour search.
+#
+# Each course gets an IVF (inverted file) index: a spherical k-means coarse
+# quantizer with ~4*sqrt(N) centroids, and the normalized chunk vectors
+# stored grouped by centroid (CSR layout: offsets into flat arrays).
+# A query scores the centroids, then only the vectors in the nprobe best
+# lists. Indexes are persisted as .npz files under ANN_INDEX_DIR, updated
+# per note on ingest and retrained when the course grows or shrinks 4x.
+
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE = 50_000
+
+
+def _nlist_for(n: int) -> int:
+    if n < ANN_MIN_TRAIN_SIZE:
+        return 1
+    return int(min(4096, max(1, 4 * np.sqrt(n))))
+
+
+def train_centroids(vectors: np.ndarray, nlist: int, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on (a sample of) normalized vectors."""
+    if nlist <= 1 or len(vectors) <= nlist:
+        centroid = vectors.mean(axis=0, keepdims=True) if len(vectors) else np.zeros((1, vectors.shape[1]), np.float32)
+        return normalize_rows(centroid.astype(np.float32))
+
+    rng = np.random.default_rng(seed)
+    sample = vectors
+    if len(vectors) > KMEANS_SAMPLE:
+        sample = vectors[rng.choice(len(vectors), KMEANS_SAMPLE, replace=False)]
+
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = counts == 0
+        # Re-seed empty clusters with random sample points
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    def __init__(self, centroids, ids, note_ids, vectors, offsets, trained_size):
+        self.centroids = centroids      # (nlist, dim)
+        self.ids = ids                  # (n,) chunk ids, grouped by list
+        self.note_ids = note_ids        # (n,) lecture note ids
+        self.vectors = vectors          # (n, dim) normalized float32
+        self.offsets = offsets          # (nlist + 1,) list boundaries
+        self.trained_size = trained_size
+
+    @property
+    def size(self) -> int:
+        return int(self.ids.size)
+
+    @classmethod
+    def build(cls, ids: np.ndarray, note_ids: np.ndarray, vectors: np.ndarray) -> "IVFIndex":
+        dim = vectors.shape[1] if vectors.ndim == 2 and vectors.size else 0
+        if dim == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return cls(np.zeros((1, 0), np.float32), empty, empty, np.zeros((0, 0), np.float32),
+                       np.zeros(2, dtype=np.int64), 0)
+        centroids = train_centroids(vectors, _nlist_for(len(vectors)))
+        index = cls(centroids, ids[:0], note_ids[:0], vectors[:0], np.zeros(len(centroids) + 1, np.int64), len(vectors))
+        index._set(*index._grouped(ids, note_ids, vectors))
+        return index
+
+    def _grouped(self, ids, note_ids, vectors):
+        assign = np.argmax(vectors @ self.centroids.T, axis=1) if len(vectors) else np.empty(0, np.int64)
+        return assign, ids, note_ids, vectors
+
+    def _set(self, assign, ids, note_ids, vectors):
+        order = np.argsort(assign, kind="stable")
+        self.ids = np.ascontiguousarray(ids[order], dtype=np.int64)
+        self.note_ids = np.ascontiguousarray(note_ids[order], dtype=np.int64)
+        self.vectors = np.ascontiguousarray(vectors[order], dtype=np.float32)
+        counts = np.bincount(assign, minlength=len(self.centroids))
+        self.offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+    def _assignments(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self.centroids)), np.diff(self.offsets))
+
+    def with_notes(self, notes: dict[int, tuple[np.ndarray, np.ndarray]]) -> "IVFIndex":
+        """
+        Copy of the index with the vectors of some notes replaced by their
+        current ones, given as {note_id: (ids, vectors)} (incremental
+        update; existing centroids are kept). Readers of the old object are
+        never affected.
+        """
+        keep = ~np.isin(self.note_ids, np.fromiter(notes, dtype=np.int64, count=len(notes)))
+        assign = [self._assignments()[keep]]
+        all_ids = [self.ids[keep]]
+        all_notes = [self.note_ids[keep]]
+        all_vecs = [self.vectors[keep]]
+        for note_id, (ids, vectors) in notes.items():
+            if len(ids):
+                assign.append(np.argmax(vectors @ self.centroids.T, axis=1))
+                all_ids.append(ids)
+                all_notes.append(np.full(len(ids), note_id, dtype=np.int64))
+                all_vecs.append(vectors)
+        assign = np.concatenate(assign)
+        all_ids = np.concatenate(all_ids)
+        all_notes = np.concatenate(all_notes)
+        all_vecs = np.concatenate(all_vecs)
+        updated = IVFIndex(self.centroids, all_ids, all_notes, all_vecs, self.offsets, self.trained_size)
+        updated._set(assign, all_ids, all_notes, all_vecs)
+        return updated
+
+    def needs_retrain(self) -> bool:
+        n, trained = self.size, max(self.trained_size, 1)
+        return _nlist_for(n) != len(self.centroids) and (n > 4 * trained or n * 4 < trained)
+
+    def search(self, query: np.ndarray, k: int, nprobe: int = ANN_NPROBE) -> tuple[np.ndarray, np.ndarray]:
+        """Return (chunk_ids, scores) of the approximate top k for a normalized query."""
+        if self.size == 0 or k <= 0:
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+
+        if nprobe < 1:
+            raise ValueError(f"nprobe must be >= 1, got {nprobe}")
+        nprobe = min(nprobe, len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        rows = np.concatenate([np.arange(self.offsets[p], self.offsets[p + 1]) for p in probes])
+        if rows.size == 0:
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+
+        scores = self.vectors[rows] @ query
+        k = min(k, scores.size)
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return self.ids[rows[best]], scores[best]
+
+    def search_exact(self, query: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Brute-force top k over every vector (ground truth for recall checks)."""
+        if self.size == 0 or k <= 0:
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+        scores = self.vectors @ query
+        k = min(k, scores.size)
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return self.ids[best], scores[best]
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique per writer: workers saving the same index must not share a temp file
+        tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp.npz"
+        np.savez(
+            tmp_path,
+            centroids=self.centroids, ids=self.ids, note_ids=self.note_ids,
+            vectors=self.vectors, offsets=self.offsets, trained_size=self.trained_size,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as data:
+            return cls(data["centroids"], data["ids"], data["note_ids"], data["vectors"],
+                       data["offsets"], int(data["trained_size"]))
+
+
+# -----------------------------------------------------
+#  Per-course index management
+# -----------------------------------------------------
+
+_lock = threading.Lock()
+_write_lock = threading.Lock()  # serializes rebuilds/updates of persisted indexes
+_loaded: dict[int, tuple[float, IVFIndex]] = {}  # course_id -> (file mtime, index)
+
+
+def _index_path(course_id: int) -> str:
+    return os.path.join(ANN_INDEX_DIR, f"course_{course_id}.npz")
+
+
+def _course_vectors(db: Session, course_id: int, note_id: int | None = None):
+    store = get_vector_store()
+    if note_id is None:
+        return store.load_course(db, course_id)
+    ids, vectors = store.load_note(db, note_id)
+    note_ids = np.full(len(ids), note_id, dtype=np.int64)
+    return np.asarray(ids, dtype=np.int64), note_ids, np.asarray(vectors, dtype=np.float32)
+
+
+def build_course_index(db: Session, course_id: int) -> IVFIndex:
+    """(Re)build a course's index from the DB and persist it."""
+    index = IVFIndex.build(*_course_vectors(db, course_id))
+    path = _index_path(course_id)
+    index.save(path)
+    with _lock:
+        _loaded[course_id] = (os.path.getmtime(path), index)
+    return index
+
+
+def get_course_index(db: Session, course_id: int) -> IVFIndex:
+    """Load a course index (reloading if another process rewrote it), building it if missing."""
+    path = _index_path(course_id)
+    if not os.path.exists(path):
+        return build_course_index(db, course_id)
+
+    mtime = os.path.getmtime(path)
+    with _lock:
+        cached = _loaded.get(course_id)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    index = IVFIndex.load(path)
+    with _lock:
+        _loaded[course_id] = (mtime, index)
+    return index
+
+
+def refresh_note(db: Session, lecture_note_id: int, course_id: int | None = None):
+    """
+    Bring a note's vectors in its course index up to date after its chunks
+    changed (ingest, re-ingest, delete). Courses without a persisted index
+    are skipped; it is built on the first course search.
+    """
+    refresh_notes(db, [lecture_note_id], course_id=course_id)
+
+
+def refresh_notes(db: Session, lecture_note_ids, course_id: int | None = None):
+    """
+    refresh_note for many notes (e.g. everything a backfill touched): each
+    affected course index is updated once and written once.
+    course_id, when given, is the course of all the notes (deleted notes
+    can no longer be looked up).
+    """
+    note_ids = sorted(set(int(n) for n in lecture_note_ids))
+    if not note_ids:
+        return
+    by_course: dict[int, list[int]] = {}
+    if course_id is not None:
+        by_course[course_id] = note_ids
+    else:
+        rows = db.query(LectureNote.id, LectureNote.course_id).filter(LectureNote.id.in_(note_ids))
+        for note_id, note_course_id in rows:
+            if note_course_id is not None:
+                by_course.setdefault(note_course_id, []).append(note_id)
+
+    for note_course_id, course_note_ids in by_course.items():
+        _refresh_course(db, note_course_id, course_note_ids)
+
+
+def _refresh_course(db: Session, course_id: int, note_ids: list[int]):
+    if not os.path.exists(_index_path(course_id)):
+        return
+
+    with _write_lock:
+        index = get_course_index(db, course_id)
+        notes = {}
+        for note_id in note_ids:
+            ids, _, vectors = _course_vectors(db, course_id, note_id=note_id)
+            notes[note_id] = (ids, vectors)
+        if index.size == 0:
+            if any(len(ids) for ids, _ in notes.values()):
+                build_course_index(db, course_id)
+            return
+        index = index.with_notes(notes)
+        if index.needs_retrain():
+            build_course_index(db, course_id)
+            return
+
+        path = _index_path(course_id)
+        index.save(path)
+        with _lock:
+            _loaded[course_id] = (os.path.getmtime(path), index)
+
+
+def search_course(db: Session, course_id: int, query_vec: np.ndarray, top_k: int, nprobe: int = ANN_NPROBE):
+    """Approximate top_k (chunk_ids, scores) over every note of a course."""
+    norm = np.linalg.norm(query_vec)
+    if norm == 0:
+        return np.empty(0, np.int64), np.empty(0, np.float32)
+    return get_course_index(db, course_id).search(query_vec / norm, top_k, nprobe)
@@ -0,0 +1,91 @@
+from sqlalchemy.orm import Session
+from api.models.chunks import Chunk
+from api.models.lecture_notes import LectureNote
+from api.services import vector_index_cache, ann_index
+from api.services.vector_store import get_vector_store
+from api.config import BACKFILL_BATCH_SIZE, EMBED_BATCH_SIZE
+from typing import Callable
+import numpy as np
+
+def backfill_embeddings(
+    db: Session,
+    course_id: int | None = None,
+    after_id: int = 0,
+    batch_size: int = BACKFILL_BATCH_SIZE,
+    max_batches: int | None = None,
+    on_batch: Callable[[dict], None] | None = None,
+) -> dict:
+    """
+    Embed chunks whose embedding is NULL (e.g. created by /pdf/process),
+    or, with an external vector store, chunks the store has no vector for.
+    Chunks are walked in id order after `after_id` (keyset cursor), encoded
+    batch_size at a time and written back with one bulk UPDATE per batch,
+    committing after each batch. Pass the returned last_id as after_id to
+    resume an interrupted or partial run.
+    on_batch(progress) is called after every committed batch with the
+    running processed/embedded/last_id counts.
+    Course ANN indexes are refreshed once, when the call ends: loop over
+    batches inside one call rather than calling with max_batches=1.
+    """
+    store = get_vector_store()
+    embedded = 0
+    processed = 0
+    batches = 0
+    last_id = after_id
+    done = False
+    refreshed: set[int] = set()
+
+    try:
+        while max_batches is None or batches < max_batches:
+            query = db.query(Chunk.id, Chunk.lecture_notes_id, Chunk.text).filter(
+                Chunk.embedding.is_(None),
+                Chunk.id > last_id,
+            )
+            if course_id is not None:
+                query = query.join(LectureNote, LectureNote.id == Chunk.lecture_notes_id).filter(
+                    LectureNote.course_id == course_id
+                )
+            rows = query.order_by(Chunk.id).limit(batch_size).all()
+            if not rows:
+                done = True
+                break
+            batch_last_id = rows[-1].id
+
+            touched = {row.lecture_notes_id for row in rows}
+            if store.external:
+                # Embedding is always NULL in MySQL here; skip chunks the store already has
+                missing = []
+                for note_id in touched:
+                    note_rows = [row for row in rows if row.lecture_notes_id == note_id]
+                    has_vec = store.contains(db, note_id, [row.id for row in note_rows])
+                    missing.extend(row for row, present in zip(note_rows, has_vec) if not present)
+                rows = sorted(missing, key=lambda row: row.id)
+
+            blobs, positions, vectors = store.embed_texts([row.text for row in rows], batch_size=EMBED_BATCH_SIZE)
+            if store.external:
+                for note_id in touched:
+                    picked = [(rows[p].id, vec) for p, vec in zip(positions, vectors) if rows[p].lecture_notes_id == note_id]
+                    if picked:
+                        store.add(note_id, [cid for cid, _ in picked], np.stack([vec for _, vec in picked]))
+            else:
+                updates = [{"id": rows[p].id, "embedding": blobs[p]} for p in positions]
+                if updates:
+                    db.bulk_update_mappings(Chunk, updates)
+                db.commit()
+            vector_index_cache.invalidate(*touched)
+            refreshed.update(touched)
+
+            processed += len(rows)
+            embedded += len(positions)
+            batches += 1
+            last_id = batch_last_id
+            if on_batch:
+                on_batch({"processed": processed, "embedded": embedded, "last_id": last_id})
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        # Course ANN indexes are rewritten once per call, not per note and batch
+        ann_index.refresh_notes(db, refreshed)
+
+    return {"processed": processed, "embedded": embedded, "last_id": last_id, "done": done}
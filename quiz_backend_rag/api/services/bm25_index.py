@@ -0,0 +1,150 @@
+from sqlalchemy.orm import Session
+from api.models.chunks import Chunk
+from api.utils.keyword_utils import tokenize_expanded
+from api.config import BM25_INDEX_DIR
+import numpy as np
+import threading
+import uuid
+import os
+
+# Per-note BM25 inverted indexes over Chunk.text.
+# Built at ingest, persisted as BM25_INDEX_DIR/note_<id>.npz:
+#   terms      sorted vocabulary
+#   offsets    CSR offsets of each term's postings
+#   post_docs  document (chunk position) of each posting
+#   post_tf    term frequency of each posting
+#   chunk_ids  chunk id of each document
+#   doc_len    terms per document
+# Scoring a query only touches the postings of its terms.
+
+K1 = 1.2
+B = 0.75
+
+
+class BM25Index:
+    def __init__(self, terms, offsets, post_docs, post_tf, chunk_ids, doc_len):
+        self.terms = terms
+        self.offsets = offsets
+        self.post_docs = post_docs
+        self.post_tf = post_tf
+        self.chunk_ids = chunk_ids
+        self.doc_len = doc_len
+        n_docs = len(chunk_ids)
+        self.avgdl = float(doc_len.mean()) if n_docs else 0.0
+        df = np.diff(offsets)
+        # BM25+ style IDF that stays positive for very common terms
+        self.idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5)) if n_docs else np.zeros(0)
+
+    @classmethod
+    def build(cls, chunk_ids: list[int], texts: list[str]) -> "BM25Index":
+        vocab: dict[str, int] = {}
+        doc_ids, term_ids, doc_len = [], [], []
+        for doc, text in enumerate(texts):
+            terms = tokenize_expanded(text)
+            term_ids.extend(vocab.setdefault(t, len(vocab)) for t in terms)
+            doc_ids.extend([doc] * len(terms))
+            doc_len.append(len(terms))
+
+        n_terms = len(vocab)
+        terms = np.array(list(vocab.keys()), dtype=str) if vocab else np.array([], dtype=str)
+        order = np.argsort(terms, kind="stable")
+        rank = np.empty(n_terms, dtype=np.int64)
+        rank[order] = np.arange(n_terms)
+
+        docs = np.asarray(doc_ids, dtype=np.int64)
+        tids = rank[np.asarray(term_ids, dtype=np.int64)] if term_ids else np.empty(0, np.int64)
+        # Postings sorted by (term, doc) with counts
+        pairs, tf = np.unique(tids * max(len(texts), 1) + docs, return_counts=True)
+        post_terms = pairs // max(len(texts), 1)
+        post_docs = pairs % max(len(texts), 1)
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(post_terms, minlength=n_terms)))).astype(np.int64)
+
+        return cls(
+            terms[order],
+            offsets,
+            post_docs.astype(np.int32),
+            tf.astype(np.float32),
+            np.asarray(chunk_ids, dtype=np.int64),
+            np.asarray(doc_len, dtype=np.float32),
+        )
+
+    def score(self, query: str) -> np.ndarray:
+        """BM25 score of every document (aligned with chunk_ids)."""
+        scores = np.zeros(len(self.chunk_ids), dtype=np.float32)
+        if not len(self.chunk_ids) or not len(self.terms):
+            return scores
+        for term in set(tokenize_expanded(query)):
+            pos = int(np.searchsorted(self.terms, term))
+            if pos >= len(self.terms) or self.terms[pos] != term:
+                continue
+            lo, hi = self.offsets[pos], self.offsets[pos + 1]
+            docs = self.post_docs[lo:hi]
+            tf = self.post_tf[lo:hi]
+            norm = K1 * (1 - B + B * self.doc_len[docs] / self.avgdl)
+            scores[docs] += self.idf[pos] * tf * (K1 + 1) / (tf + norm)
+        return scores
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique per writer: workers saving the same index must not share a temp file
+        tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp.npz"
+        np.savez(
+            tmp_path,
+            terms=self.terms, offsets=self.offsets, post_docs=self.post_docs,
+            post_tf=self.post_tf, chunk_ids=self.chunk_ids, doc_len=self.doc_len,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path) as data:
+            return cls(data["terms"], data["offsets"], data["post_docs"], data["post_tf"],
+                       data["chunk_ids"], data["doc_len"])
+
+
+_lock = threading.Lock()
+_loaded: dict[int, tuple[float, BM25Index]] = {}  # note id -> (file mtime, index)
+
+
+def _index_path(lecture_note_id: int) -> str:
+    return os.path.join(BM25_INDEX_DIR, f"note_{lecture_note_id}.npz")
+
+
+def build_note_index(db: Session, lecture_note_id: int) -> BM25Index:
+    """(Re)build and persist the BM25 index of a note from its chunk texts."""
+    rows = (
+        db.query(Chunk.id, Chunk.text)
+        .filter(Chunk.lecture_notes_id == lecture_note_id)
+        .order_by(Chunk.id)
+        .all()
+    )
+    index = BM25Index.build([row.id for row in rows], [row.text for row in rows])
+    path = _index_path(lecture_note_id)
+    index.save(path)
+    with _lock:
+        _loaded[lecture_note_id] = (os.path.getmtime(path), index)
+    return index
+
+
+def get_note_index(db: Session, lecture_note_id: int) -> BM25Index:
+    """Load a note's BM25 index (reloading if rewritten), building it if missing."""
+    path = _index_path(lecture_note_id)
+    if not os.path.exists(path):
+        return build_note_index(db, lecture_note_id)
+    mtime = os.path.getmtime(path)
+    with _lock:
+        cached = _loaded.get(lecture_note_id)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    index = BM25Index.load(path)
+    with _lock:
+        _loaded[lecture_note_id] = (mtime, index)
+    return index
+
+
+def remove_note(lecture_note_id: int):
+    with _lock:
+        _loaded.pop(lecture_note_id, None)
+    path = _index_path(lecture_note_id)
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,351 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
+from api.database import SessionLocal
+from api.models.chunks import Chunk
+from api.models.ingest_jobs import IngestJob
+from api.models.lecture_notes import LectureNote
+from api.services import ingest_service, vector_index_cache, ann_index, bm25_index
+from api.services.vector_store import get_vector_store
+from api.config import INGEST_WORKERS, INGEST_QUEUE_SIZE, INGEST_MAX_RETRIES, INGEST_STALE_AFTER_SECS
+import os
+import socket
+import threading
+import time
+import uuid
+
+# Background ingestion of lecture notes.
+# Uploads are queued here and processed on a small, bounded thread pool so
+# the HTTP request returns as soon as the file is on disk.
+# Job state is kept in the ingest_jobs table (one row per lecture note), so
+# every worker process sees it and it survives restarts; jobs a dead
+# process left behind are cleaned up by recover_interrupted_jobs().
+
+_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+# Bounds queued + running jobs so a burst of uploads cannot pile up unbounded work
+_slots = threading.BoundedSemaphore(INGEST_WORKERS + INGEST_QUEUE_SIZE)
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+TERMINAL_STAGES = ("done", "failed")
+# Progress is written back at most this often (each write is a DB commit)
+PROGRESS_MIN_STEP = 0.01
+PROGRESS_MIN_INTERVAL_SECS = 1.0
+
+
+class IngestQueueFull(Exception):
+    """Raised when no slot is free for another ingestion job."""
+
+
+class IngestJobActive(Exception):
+    """Raised when the note already has a queued or running job (in any process)."""
+
+
+def _update(note_id: int, **fields):
+    db = SessionLocal()
+    try:
+        job = db.query(IngestJob).get(note_id)
+        if job is not None:
+            for key, value in fields.items():
+                setattr(job, key, value)
+            job.updated_at = datetime.utcnow()
+            db.commit()
+    finally:
+        db.close()
+
+
+def _as_dict(job: IngestJob) -> dict:
+    return {
+        "job_id": job.job_id,
+        "lecture_note_id": job.lecture_note_id,
+        "stage": job.stage,
+        "progress": job.progress or 0.0,
+        "attempt": job.attempt or 0,
+        "chunks_created": job.chunks_created or 0,
+        "embeddings_created": job.embeddings_created or 0,
+        "incremental": bool(job.incremental),
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at.isoformat(),
+        "updated_at": job.updated_at.isoformat(),
+    }
+
+
+def get_status(note_id: int) -> dict | None:
+    """Return the job state for a lecture note (None if it never had a job)."""
+    db = SessionLocal()
+    try:
+        job = db.query(IngestJob).get(note_id)
+        return _as_dict(job) if job else None
+    finally:
+        db.close()
+
+
+def is_active(note_id: int) -> bool:
+    """True while a job for this note is queued or running (in any process)."""
+    status = get_status(note_id)
+    return status is not None and status["stage"] not in TERMINAL_STAGES
+
+
+def submit(note_id: int, file_path: str, incremental: bool = False, original_name: str | None = None) -> str:
+    """
+    Queue a lecture note for ingestion and return the job id.
+    With incremental=True the note's existing chunks are synced by content
+    hash (only new/changed chunks are embedded) instead of created from scratch,
+    and file_path replaces the note's PDF: the note is switched to it (and to
+    original_name) and the old file removed only when the job succeeds.
+    Raises IngestQueueFull if the pool and its queue are saturated, and
+    IngestJobActive if the note already has an unfinished job.
+    """
+    if not _slots.acquire(blocking=False):
+        raise IngestQueueFull("Ingestion queue is full, try again later")
+
+    job_id = str(uuid.uuid4())
+    now = datetime.utcnow()
+    fields = {
+        "job_id": job_id,
+        "stage": "queued",
+        "progress": 0.0,
+        "attempt": 0,
+        "chunks_created": 0,
+        "embeddings_created": 0,
+        "incremental": incremental,
+        "file_path": file_path,
+        "new_name": original_name,
+        "result": None,
+        "error": None,
+        "owner": _OWNER,
+        "created_at": now,
+        "updated_at": now,
+    }
+    db = SessionLocal()
+    try:
+        # Claim the note's job row in one statement: only a finished job can
+        # be replaced, so concurrent submits for a note cannot both win
+        claimed = db.query(IngestJob).filter(
+            IngestJob.lecture_note_id == note_id,
+            IngestJob.stage.in_(TERMINAL_STAGES),
+        ).update(fields, synchronize_session=False)
+        if not claimed:
+            if db.query(IngestJob.lecture_note_id).filter(IngestJob.lecture_note_id == note_id).first():
+                raise IngestJobActive("Ingestion already in progress for this note")
+            db.add(IngestJob(lecture_note_id=note_id, **fields))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another submit inserted the note's first job row first
+            db.rollback()
+            raise IngestJobActive("Ingestion already in progress for this note")
+    except Exception:
+        _slots.release()
+        raise
+    finally:
+        db.close()
+
+    try:
+        _executor.submit(_run, note_id, file_path, incremental, original_name)
+    except Exception:
+        _slots.release()
+        _update(note_id, stage="failed", error="Could not schedule the job")
+        raise
+    return job_id
+
+
+def file_in_use(db, file_path: str, exclude_note_id: int | None = None) -> bool:
+    """True if a note points at file_path or an unfinished job is ingesting it."""
+    if db.query(LectureNote.id).filter(LectureNote.file_path == file_path).first():
+        return True
+    pending = db.query(IngestJob.lecture_note_id).filter(
+        IngestJob.file_path == file_path,
+        IngestJob.stage.notin_(TERMINAL_STAGES),
+    )
+    if exclude_note_id is not None:
+        pending = pending.filter(IngestJob.lecture_note_id != exclude_note_id)
+    return pending.first() is not None
+
+
+def _remove_file_if_unused(db, file_path: str, exclude_note_id: int | None = None):
+    if file_path and os.path.exists(file_path) and not file_in_use(db, file_path, exclude_note_id):
+        os.remove(file_path)
+
+
+def _switch_note_file(db, note_id: int, file_path: str, original_name: str | None):
+    """Point the note at its replacement PDF and drop the old file if nothing else uses it."""
+    note = db.query(LectureNote).get(note_id)
+    if note is None or note.file_path == file_path:
+        return
+    old_path = note.file_path
+    note.file_path = file_path
+    if original_name:
+        note.original_name = original_name
+    db.commit()
+    _remove_file_if_unused(db, old_path, exclude_note_id=note_id)
+
+
+def _discard_replacement(note_id: int, file_path: str):
+    """A failed replacement keeps the old PDF; remove the new one unless something uses it."""
+    db = SessionLocal()
+    try:
+        _remove_file_if_unused(db, file_path, exclude_note_id=note_id)
+    finally:
+        db.close()
+
+
+def _set_ingested(db, note_id: int, done: bool):
+    """Set or clear the note's completion marker (LectureNote.ingested_at)."""
+    db.query(LectureNote).filter(LectureNote.id == note_id).update(
+        {LectureNote.ingested_at: datetime.utcnow() if done else None},
+        synchronize_session=False,
+    )
+    db.commit()
+
+
+def mark_existing_notes_ingested():
+    """
+    One-off when the ingested_at column is introduced: notes that already
+    have chunks and no unfinished job were ingested before markers existed.
+    """
+    db = SessionLocal()
+    try:
+        unfinished = select(IngestJob.lecture_note_id).where(IngestJob.stage.notin_(TERMINAL_STAGES))
+        db.query(LectureNote).filter(
+            LectureNote.chunks.any(),
+            LectureNote.id.notin_(unfinished),
+        ).update({LectureNote.ingested_at: func.now()}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _owner_is_gone(owner: str | None) -> bool:
+    """True if the job's process is known to be dead (only checkable on this host)."""
+    if not owner or ":" not in owner:
+        return True
+    host, pid = owner.rsplit(":", 1)
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    if int(pid) == os.getpid():
+        return True  # a previous process that had our pid
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        return False
+    return False
+
+
+def recover_interrupted_jobs() -> int:
+    """
+    Fail jobs left in a non-terminal stage by a process that died (crash,
+    restart), removing the partial chunks of full ingestions. Jobs of other
+    hosts count as dead once not updated for INGEST_STALE_AFTER_SECS.
+    Returns the number of jobs recovered. Called on startup.
+    """
+    stale_before = datetime.utcnow() - timedelta(seconds=INGEST_STALE_AFTER_SECS)
+    db = SessionLocal()
+    try:
+        jobs = db.query(IngestJob).filter(IngestJob.stage.notin_(TERMINAL_STAGES)).all()
+        interrupted = [
+            (job.lecture_note_id, bool(job.incremental), job.file_path)
+            for job in jobs
+            if _owner_is_gone(job.owner) or job.updated_at < stale_before
+        ]
+    finally:
+        db.close()
+
+    for note_id, incremental, file_path in interrupted:
+        _update(note_id, stage="failed", error="Interrupted (worker stopped before the job finished)")
+        # Incremental syncs run in one transaction, so nothing partial was
+        # committed; only the unused replacement file is left to remove
+        if incremental:
+            _discard_replacement(note_id, file_path)
+        else:
+            _cleanup_partial(note_id)
+    return len(interrupted)
+
+
+def _cleanup_partial(note_id: int):
+    """Delete any chunks a failed attempt left behind for this note."""
+    db = SessionLocal()
+    try:
+        db.query(Chunk).filter(Chunk.lecture_notes_id == note_id).delete(synchronize_session=False)
+        db.commit()
+        _set_ingested(db, note_id, False)
+        get_vector_store().remove(note_id)
+        vector_index_cache.invalidate(note_id)
+        ann_index.refresh_note(db, note_id)
+        bm25_index.remove_note(note_id)
+    finally:
+        db.close()
+
+
+def _run(note_id: int, file_path: str, incremental: bool, original_name: str | None = None):
+    succeeded = False
+    try:
+        for attempt in range(1, INGEST_MAX_RETRIES + 2):
+            _update(note_id, attempt=attempt, stage="extracting", progress=0.0, error=None)
+            db = SessionLocal()
+            last_written = {"progress": 0.0, "at": time.monotonic()}
+            try:
+                def on_progress(done: int, total: int):
+                    progress = round(done / total, 4) if total else 1.0
+                    now = time.monotonic()
+                    if progress < 1.0 and (
+                        progress - last_written["progress"] < PROGRESS_MIN_STEP
+                        or now - last_written["at"] < PROGRESS_MIN_INTERVAL_SECS
+                    ):
+                        return
+                    last_written.update(progress=progress, at=now)
+                    _update(note_id, progress=progress)
+
+                if incremental:
+                    text = ingest_service.extract_text_from_pdf(file_path)
+                    _update(note_id, stage="embedding")
+                    result = ingest_service.reingest_changed_chunks(
+                        db, note_id, text, progress_cb=on_progress
+                    )
+                    chunks_count = result["chunks_total"]
+                    embeddings_count = result["embeddings_created"]
+                    _switch_note_file(db, note_id, file_path, original_name)
+                else:
+                    # Pages stream straight into chunking/embedding; progress is pages consumed
+                    _update(note_id, stage="embedding")
+                    result = None
+                    chunks_count, embeddings_count = ingest_service.ingest_pdf_streaming(
+                        db, note_id, file_path, progress_cb=on_progress
+                    )
+                _set_ingested(db, note_id, True)
+                _update(
+                    note_id,
+                    stage="done",
+                    progress=1.0,
+                    chunks_created=chunks_count,
+                    embeddings_created=embeddings_count,
+                    result=result,
+                )
+                succeeded = True
+                return
+            except FileNotFoundError as e:
+                # Retrying cannot bring the file back
+                db.rollback()
+                if not incremental:
+                    _cleanup_partial(note_id)
+                _update(note_id, stage="failed", error=str(e))
+                return
+            except Exception as e:
+                db.rollback()
+                # Incremental syncs commit in a single transaction, so the
+                # rollback already restores the previous chunks
+                if not incremental:
+                    _cleanup_partial(note_id)
+                if attempt > INGEST_MAX_RETRIES:
+                    _update(note_id, stage="failed", error=str(e))
+                    return
+                _update(note_id, stage="retrying", error=str(e))
+                time.sleep(2 ** attempt)  # simple backoff
+            finally:
+                db.close()
+    finally:
+        if incremental and not succeeded:
+            _discard_replacement(note_id, file_path)
+        _slots.release()
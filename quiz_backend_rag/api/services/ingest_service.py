@@ -1,22 +1,182 @@
 
 from pypdf import PdfReader
+from sqlalchemy import select, insert, literal, func
 from sqlalchemy.orm import Session
 from api.models.chunks import Chunk
-from api.utils.embedding_utils import generate_embedding
+from api.utils.embedding_utils import get_tokenizer, max_chunk_tokens
+from api.utils.keyword_utils import extract_keywords
+from api.utils.pdf_utils import extract_page_range
+from api.services import vector_index_cache, ann_index, bm25_index
+from api.services.vector_store import get_vector_store
+from api.config import (
+    EMBED_BATCH_SIZE,
+    PDF_EXTRACT_WORKERS,
+    PDF_PAGES_PER_SHARD,
+    CHUNK_MAX_TOKENS,
+    CHUNK_OVERLAP_TOKENS,
+    KEYWORDS_PER_CHUNK,
+)
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from typing import BinaryIO, Callable, Iterable, Iterator
+import numpy as np
+import multiprocessing
+import threading
+import hashlib
+import uuid
 import re
 import os
 
-def extract_text_from_pdf(file_path: str) -> str:
-    """Read PDF file and extract text."""
+UPLOAD_READ_BLOCK = 1024 * 1024  # 1 MiB
+
+_extract_pool = None
+_extract_pool_lock = threading.Lock()
+
+def _get_extract_pool() -> ProcessPoolExecutor:
+    """Create the shared extraction process pool on first use."""
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is None:
+            # spawn, not fork: the pool is created from worker threads of a
+            # process that has torch and many threads loaded, where fork can deadlock
+            _extract_pool = ProcessPoolExecutor(
+                max_workers=PDF_EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _extract_pool
+
+def _reset_extract_pool(pool: ProcessPoolExecutor):
+    """Drop a broken pool (e.g. a worker was OOM-killed) so the next call starts a fresh one."""
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is pool:
+            _extract_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def count_pdf_pages(file_path: str) -> int:
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"File not found: {file_path}")
+    return len(PdfReader(file_path).pages)
+
+def iter_pdf_pages(file_path: str) -> Iterator[str]:
+    """
+    Yield the text of each PDF page in order.
+    Pages are extracted in page-range shards; large documents use the
+    process pool with at most 2 * PDF_EXTRACT_WORKERS shards in flight,
+    so memory is bounded by the shard size rather than the document size.
+    """
+    num_pages = count_pdf_pages(file_path)
+    shards = iter([
+        (start, min(start + PDF_PAGES_PER_SHARD, num_pages))
+        for start in range(0, num_pages, PDF_PAGES_PER_SHARD)
+    ])
+
+    if PDF_EXTRACT_WORKERS <= 1 or num_pages <= PDF_PAGES_PER_SHARD:
+        for start, end in shards:
+            yield from extract_page_range(file_path, start, end)
+        return
 
-    reader = PdfReader(file_path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() + "\n"
-    
-    return text
+    pool = _get_extract_pool()
+    try:
+        pending = deque(
+            pool.submit(extract_page_range, file_path, start, end)
+            for start, end in islice(shards, PDF_EXTRACT_WORKERS * 2)
+        )
+        while pending:
+            pages = pending.popleft().result()
+            next_shard = next(shards, None)
+            if next_shard:
+                pending.append(pool.submit(extract_page_range, file_path, *next_shard))
+            yield from pages
+    except BrokenProcessPool:
+        _reset_extract_pool(pool)
+        raise
+
+def extract_text_from_pdf(file_path: str) -> str:
+    """
+    Read PDF file and extract text.
+    Large documents are split into page-range shards that are extracted
+    in parallel on a process pool and joined back in page order.
+    """
+    # Same layout as before ("\n" after every page), built in linear time
+    return "".join(page + "\n" for page in iter_pdf_pages(file_path))
+
+def save_upload_hashed(src: BinaryIO, upload_dir: str, file_ext: str) -> tuple[str, bool]:
+    """
+    Stream an upload to disk while hashing it (SHA-256).
+    The file is stored content-addressed as <sha256><ext>; if that file
+    already exists the new copy is discarded.
+    Returns (file_path, is_new).
+    """
+    os.makedirs(upload_dir, exist_ok=True)
+    hasher = hashlib.sha256()
+    tmp_path = os.path.join(upload_dir, f".{uuid.uuid4()}.part")
+
+    try:
+        with open(tmp_path, "wb") as buffer:
+            while True:
+                block = src.read(UPLOAD_READ_BLOCK)
+                if not block:
+                    break
+                hasher.update(block)
+                buffer.write(block)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    file_path = os.path.join(upload_dir, f"{hasher.hexdigest()}{file_ext.lower()}")
+    if os.path.exists(file_path):
+        os.remove(tmp_path)
+        return file_path, False
+
+    os.replace(tmp_path, file_path)
+    return file_path, True
+
+def clone_chunks(db: Session, source_note_id: int, target_note_id: int) -> tuple[int, int]:
+    """
+    Copy all chunk rows (text, keywords, embedding) of one lecture note to
+    another with a single INSERT ... SELECT. Used for duplicate uploads.
+    Returns (chunks_created, embeddings_created).
+    """
+    sel = select(
+        literal(target_note_id),
+        Chunk.chunk_index,
+        Chunk.text,
+        Chunk.keywords,
+        Chunk.embedding,
+    ).where(Chunk.lecture_notes_id == source_note_id)
+
+    db.execute(
+        insert(Chunk).from_select(
+            ["lecture_notes_id", "chunk_index", "text", "keywords", "embedding"], sel
+        )
+    )
+    db.commit()
+
+    store = get_vector_store()
+    chunks_count = db.query(func.count(Chunk.id)).filter(Chunk.lecture_notes_id == target_note_id).scalar()
+    if store.external:
+        # Copy the source vectors under the new chunk ids (matched by chunk_index)
+        src_ids, src_vectors = store.load_note(db, source_note_id)
+        index_by_src_id = dict(
+            db.query(Chunk.id, Chunk.chunk_index).filter(Chunk.lecture_notes_id == source_note_id).all()
+        )
+        src_indexes = [index_by_src_id[int(cid)] for cid in src_ids]
+        id_by_index = _chunk_ids_by_index(db, target_note_id, src_indexes)
+        store.add(target_note_id, [id_by_index[i] for i in src_indexes], np.asarray(src_vectors))
+        embeddings_count = len(src_indexes)
+    else:
+        embeddings_count = db.query(func.count(Chunk.id)).filter(
+            Chunk.lecture_notes_id == target_note_id, Chunk.embedding.isnot(None)
+        ).scalar()
+
+    vector_index_cache.invalidate(target_note_id)
+    ann_index.refresh_note(db, target_note_id)
+    bm25_index.build_note_index(db, target_note_id)
+    return chunks_count, embeddings_count
 
 def clean_text(raw: str) -> str:
     """Clean PDF extracted text before chunking."""
@@ -42,87 +202,342 @@ def clean_text(raw: str) -> str:
 
     return text.strip()
 
-def split_into_chunks(text: str, chunk_size: int = 1000, overlap: int = 150) -> list[str]:
+_SENTENCE_RE = re.compile(r".+?(?:[.!?](?=\s)|$)", re.DOTALL)
+_TOKENIZE_BATCH = 256  # sentences per tokenizer call
+
+_MAX_SENTENCE_CARRY = 4000  # chars; flush run-on text with no sentence end
+
+def _iter_sentences(segments: Iterable[str]) -> Iterator[str]:
+    """
+    Yield sentences from a stream of text segments (e.g. cleaned pages).
+    A trailing sentence without end punctuation is carried over to the
+    next segment, so sentences spanning page breaks stay whole.
+    """
+    carry = ""
+    for segment in segments:
+        if not segment:
+            continue
+        text = f"{carry} {segment}" if carry else segment
+        carry = ""
+
+        last = None
+        for m in _SENTENCE_RE.finditer(text):
+            if last:
+                yield last
+            last = m.group(0).strip()
+
+        if last and (last[-1] in ".!?" or len(last) > _MAX_SENTENCE_CARRY):
+            yield last
+        elif last:
+            carry = last
+
+    if carry:
+        yield carry
+
+def _iter_sentence_pieces(segments: Iterable[str], max_tokens: int) -> Iterator[tuple[str, int]]:
     """
-    Split text into character-based chunks with overlap.
-    TARGET: ~800-1200 chars. Default 1000.
-    OVERLAP: ~100-150 chars. Default 150.
+    Yield (sentence, token_count) pairs in order.
+    Sentences are tokenized in batches with the encoder's tokenizer; a
+    sentence longer than max_tokens is cut into max_tokens-sized pieces
+    at token offsets.
+    """
+    tokenizer = get_tokenizer()
+
+    batch = []
+    for sentence in _iter_sentences(segments):
+        batch.append(sentence)
+        if len(batch) < _TOKENIZE_BATCH:
+            continue
+        yield from _split_sentence_batch(tokenizer, batch, max_tokens)
+        batch = []
+    if batch:
+        yield from _split_sentence_batch(tokenizer, batch, max_tokens)
+
+def _split_sentence_batch(tokenizer, batch: list[str], max_tokens: int) -> Iterator[tuple[str, int]]:
+    encoded = tokenizer(batch, add_special_tokens=False, return_offsets_mapping=True)
+    for sentence, offsets in zip(batch, encoded["offset_mapping"]):
+        n_tokens = len(offsets)
+        if n_tokens <= max_tokens:
+            yield sentence, n_tokens
+            continue
+        for i in range(0, n_tokens, max_tokens):
+            window = offsets[i:i + max_tokens]
+            yield sentence[window[0][0]:window[-1][1]], len(window)
+
+def iter_chunks(
+    text: str | Iterable[str],
+    max_tokens: int | None = None,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> Iterator[str]:
+    """
+    Stream token-budget chunks of text (a string or a stream of cleaned
+    segments such as pages).
+    Chunks are built from whole sentences so that each fits in max_tokens
+    wordpieces of the embedding model (defaults to the encoder's max
+    sequence length), so nothing is truncated at encode time. Consecutive
+    chunks share up to overlap_tokens of trailing sentences.
+    Each sentence is tokenized once, so the whole pass is linear in len(text).
     """
     if not text:
-        return []
-    
-    chunks = []
-    start = 0
-    text_len = len(text)
-
-    while start < text_len:
-        end = start + chunk_size
-        
-        # If we are near the end, just take the rest
-        if end >= text_len:
-            chunks.append(text[start:])
+        return
+    segments = [text] if isinstance(text, str) else text
+    if max_tokens is None:
+        max_tokens = CHUNK_MAX_TOKENS or max_chunk_tokens()
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+
+    window: deque[tuple[str, int]] = deque()
+    window_tokens = 0
+    has_new = False  # window holds sentences not emitted yet
+
+    for sentence, n_tokens in _iter_sentence_pieces(segments, max_tokens):
+        if window and window_tokens + n_tokens > max_tokens:
+            if has_new:
+                yield " ".join(s for s, _ in window)
+            # Keep only the overlap tail (and leave room for this sentence)
+            while window and (window_tokens > overlap_tokens or window_tokens + n_tokens > max_tokens):
+                _, dropped = window.popleft()
+                window_tokens -= dropped
+            has_new = False
+
+        window.append((sentence, n_tokens))
+        window_tokens += n_tokens
+        has_new = True
+
+    if window and has_new:
+        yield " ".join(s for s, _ in window)
+
+def split_into_chunks(
+    text: str,
+    max_tokens: int | None = None,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> list[str]:
+    """
+    Split text into sentence-aligned chunks that fit the encoder's token
+    budget, with overlap. See iter_chunks.
+    """
+    return list(iter_chunks(text, max_tokens=max_tokens, overlap_tokens=overlap_tokens))
+
+def _chunk_ids_by_index(db: Session, lecture_note_id: int, chunk_indexes: list[int]) -> dict[int, int]:
+    """Map chunk_index -> id for freshly inserted chunks of a note."""
+    rows = db.query(Chunk.id, Chunk.chunk_index).filter(
+        Chunk.lecture_notes_id == lecture_note_id,
+        Chunk.chunk_index.in_(chunk_indexes),
+    )
+    return {row.chunk_index: row.id for row in rows}
+
+def _store_external_vectors(db: Session, store, lecture_note_id: int, batches: list[tuple[list[int], np.ndarray]]):
+    """
+    Hand vectors of inserted chunks, given as (chunk_indexes, vectors)
+    batches, to an external vector store (keyed by chunk id) in a single
+    add: the mmap store rewrites the note's file on every add.
+    """
+    batches = [(indexes, vectors) for indexes, vectors in batches if indexes]
+    if not batches:
+        return
+    chunk_indexes = [i for indexes, _ in batches for i in indexes]
+    id_by_index = _chunk_ids_by_index(db, lecture_note_id, chunk_indexes)
+    store.add(
+        lecture_note_id,
+        [id_by_index[i] for i in chunk_indexes],
+        np.concatenate([np.asarray(vectors, dtype=np.float32) for _, vectors in batches]),
+    )
+
+def _store_chunk_stream(
+    db: Session,
+    lecture_note_id: int,
+    chunks: Iterable[str],
+    batch_size: int,
+    on_batch: Callable[[int], None] | None = None,
+) -> tuple[int, int]:
+    """
+    Embed and store a stream of chunk texts batch by batch.
+    Each batch is encoded with one encode call, written with one bulk
+    INSERT and committed, so only batch_size chunks of text are held at a
+    time. With an external vector store the vectors are kept until the
+    stream ends and stored with one write for the note.
+    """
+    store = get_vector_store()
+    chunks_count = 0
+    embeddings_count = 0
+    external_vectors = []  # (chunk_indexes, vectors) batches for the external store
+    it = iter(chunks)
+
+    while True:
+        batch = list(islice(it, batch_size))
+        if not batch:
             break
-        
-        # Try to find a space or punctuation to break on near the end
-        # We look back from 'end' to find a suitable break point
-        # to avoid splitting words in half if possible.
-        # Look back up to 'overlap' distance? Or just a small window?
-        # Let's just hard slice for now if we want strict char limits, 
-        # but better to break on space.
-        
-        # Simple algorithm: slice exactly, but maybe backup to last space?
-        # Let's try to back up to the last space within the last 50 chars of the chunk
-        # to avoid cutting words.
-        
-        slice_candidate = text[start:end]
-        last_space = slice_candidate.rfind(' ')
-        
-        # If valid space found in the last 10% of the chunk, break there
-        if last_space != -1 and last_space > (chunk_size * 0.9):
-            end = start + last_space
-        
-        chunks.append(text[start:end])
-        
-        # Move start forward, respecting overlap
-        start = end - overlap
-        
-        # Helper to avoid infinite loop if overlap >= chunk_size (shouldn't happen with defaults)
-        if start >= end:
-            start = end
-
-    return chunks
-
-def process_and_store_chunks(db: Session, lecture_note_id: int, text: str):
-    """
-    Splits text, generates embeddings, and stores Chunks in DB.
-    """
-    # 1. Clean
+        blobs, positions, vectors = store.embed_texts(batch, batch_size=batch_size)
+        embeddings_count += len(positions)
+
+        rows = []
+        for content, emb_bytes in zip(batch, blobs):
+            rows.append({
+                "lecture_notes_id": lecture_note_id,
+                "chunk_index": chunks_count,
+                "text": content,
+                "keywords": None, # Placeholder for future
+                "embedding": emb_bytes,
+            })
+            chunks_count += 1
+
+        db.bulk_insert_mappings(Chunk, rows)
+        db.commit()
+        if store.external and positions:
+            external_vectors.append(([rows[p]["chunk_index"] for p in positions], vectors))
+        vector_index_cache.invalidate(lecture_note_id)
+
+        if on_batch:
+            on_batch(chunks_count)
+
+    if external_vectors:
+        _store_external_vectors(db, store, lecture_note_id, external_vectors)
+        vector_index_cache.invalidate(lecture_note_id)
+
+    return chunks_count, embeddings_count
+
+def update_note_keywords(db: Session, lecture_note_id: int, top_n: int = KEYWORDS_PER_CHUNK) -> int:
+    """
+    Recompute Chunk.keywords for every chunk of a note with TF-IDF over
+    the note's chunks and store them with one bulk UPDATE.
+    Returns the number of chunks updated.
+    """
+    rows = (
+        db.query(Chunk.id, Chunk.text)
+        .filter(Chunk.lecture_notes_id == lecture_note_id)
+        .order_by(Chunk.chunk_index)
+        .all()
+    )
+    if not rows:
+        return 0
+
+    keywords = extract_keywords([row.text for row in rows], top_n=top_n)
+    db.bulk_update_mappings(
+        Chunk,
+        [{"id": row.id, "keywords": kws} for row, kws in zip(rows, keywords)],
+    )
+    db.commit()
+    return len(rows)
+
+def ingest_pdf_streaming(
+    db: Session,
+    lecture_note_id: int,
+    file_path: str,
+    batch_size: int = EMBED_BATCH_SIZE,
+    progress_cb: Callable[[int, int], None] | None = None,
+):
+    """
+    Memory-bounded ingestion of a PDF:
+    pages -> cleaned pages -> chunks -> embedding batches -> batch commits.
+    Nothing holds the whole document; peak memory depends on batch_size
+    and the extraction shard size. Chunks are committed per batch, so a
+    failed run leaves partial chunks for the caller to clean up.
+    progress_cb(pages_done, total_pages) is called as pages are consumed.
+    Returns (chunks_created, embeddings_created).
+    """
+    total_pages = count_pdf_pages(file_path)
+
+    def cleaned_pages():
+        for page_no, page in enumerate(iter_pdf_pages(file_path), start=1):
+            yield clean_text(page)
+            if progress_cb:
+                progress_cb(page_no, total_pages)
+
+    counts = _store_chunk_stream(db, lecture_note_id, iter_chunks(cleaned_pages()), batch_size)
+    update_note_keywords(db, lecture_note_id)
+    ann_index.refresh_note(db, lecture_note_id)
+    bm25_index.build_note_index(db, lecture_note_id)
+    return counts
+
+def chunk_hash(content: str) -> str:
+    """Content hash used to match re-extracted chunks with stored ones."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def reingest_changed_chunks(
+    db: Session,
+    lecture_note_id: int,
+    text: str,
+    batch_size: int = EMBED_BATCH_SIZE,
+    progress_cb: Callable[[int, int], None] | None = None,
+) -> dict:
+    """
+    Re-chunk text for an existing lecture note and sync it with the stored
+    Chunk rows by content hash:
+    - unchanged chunks keep their id (chunk_index is updated if it moved),
+    - new or changed chunks are embedded and inserted,
+    - chunks no longer present are deleted.
+    Everything is committed in one transaction.
+    """
     cleaned_text = clean_text(text)
-    
-    # 2. Chunk
     chunks_text = split_into_chunks(cleaned_text)
-    
-    if not chunks_text:
-        return 0, 0
 
-    embeddings_count = 0
-    
-    # 3. Process & Store
+    existing = (
+        db.query(Chunk.id, Chunk.chunk_index, Chunk.text)
+        .filter(Chunk.lecture_notes_id == lecture_note_id)
+        .order_by(Chunk.chunk_index)
+        .all()
+    )
+    by_hash: dict[str, list] = {}
+    for row in existing:
+        by_hash.setdefault(chunk_hash(row.text), []).append(row)
+
+    reindex_rows = []
+    new_chunks = []  # (chunk_index, content)
     for idx, content in enumerate(chunks_text):
-        # Generate embedding
-        emb_bytes = generate_embedding(content)
-        if emb_bytes:
-            embeddings_count += 1
-            
-        chunk = Chunk(
-            lecture_notes_id=lecture_note_id,
-            chunk_index=idx,
-            text=content,
-            keywords=None, # Placeholder for future
-            embedding=emb_bytes
-        )
-        db.add(chunk)
-    
+        matches = by_hash.get(chunk_hash(content))
+        if matches:
+            row = matches.pop(0)
+            if row.chunk_index != idx:
+                reindex_rows.append({"id": row.id, "chunk_index": idx})
+        else:
+            new_chunks.append((idx, content))
+
+    stale_ids = [row.id for rows in by_hash.values() for row in rows]
+    store = get_vector_store()
+
+    if stale_ids:
+        db.query(Chunk).filter(Chunk.id.in_(stale_ids)).delete(synchronize_session=False)
+    if reindex_rows:
+        db.bulk_update_mappings(Chunk, reindex_rows)
+
+    embeddings_count = 0
+    external_vectors = []  # (chunk_indexes, vectors) to hand to an external store after commit
+    for start in range(0, len(new_chunks), batch_size):
+        batch = new_chunks[start:start + batch_size]
+        blobs, positions, vectors = store.embed_texts([content for _, content in batch], batch_size=batch_size)
+        embeddings_count += len(positions)
+        if store.external and positions:
+            external_vectors.append(([batch[p][0] for p in positions], vectors))
+
+        rows = []
+        for (idx, content), emb_bytes in zip(batch, blobs):
+            rows.append({
+                "lecture_notes_id": lecture_note_id,
+                "chunk_index": idx,
+                "text": content,
+                "keywords": None,
+                "embedding": emb_bytes,
+            })
+        db.bulk_insert_mappings(Chunk, rows)
+
+        if progress_cb:
+            progress_cb(start + len(batch), len(new_chunks))
+
     db.commit()
-    
-    return len(chunks_text), embeddings_count
+    if store.external:
+        store.remove(lecture_note_id, stale_ids)
+        _store_external_vectors(db, store, lecture_note_id, external_vectors)
+    vector_index_cache.invalidate(lecture_note_id)
+    ann_index.refresh_note(db, lecture_note_id)
+    bm25_index.build_note_index(db, lecture_note_id)
+
+    # IDF depends on every chunk of the note, so refresh all keywords
+    update_note_keywords(db, lecture_note_id)
+
+    return {
+        "chunks_total": len(chunks_text),
+        "chunks_unchanged": len(chunks_text) - len(new_chunks),
+        "chunks_added": len(new_chunks),
+        "chunks_removed": len(stale_ids),
+        "chunks_reindexed": len(reindex_rows),
+        "embeddings_created": embeddings_count,
+    }
@@ -0,0 +1,143 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from api.config import LLM_WORKERS, LLM_QUEUE_SIZE
+import asyncio
+import functools
+import threading
+import time
+
+# Dedicated executor for blocking LLM inference.
+# llama.cpp calls hold a CPU core set for seconds, so async endpoints hand
+# them to this pool instead of running them on the event loop (which would
+# stall every other request on the worker). Admission is per generation
+# request, not per call: reserve() admits at most LLM_WORKERS +
+# LLM_QUEUE_SIZE requests and fails fast with LLMQueueFull beyond that, so
+# the endpoint can answer 503 right away. An admitted request issues its
+# calls one at a time and is never rejected halfway through, so at most
+# LLM_WORKERS calls run and the others wait.
+
+_executor = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm")
+_slots = threading.BoundedSemaphore(LLM_WORKERS + LLM_QUEUE_SIZE)
+_lock = threading.Lock()
+_stats = {
+    "admitted": 0,
+    "active_requests": 0,
+    "rejected": 0,
+    "submitted": 0,
+    "completed": 0,
+    "failed": 0,
+    "queued": 0,
+    "running": 0,
+    "wait_ms_total": 0.0,
+    "wait_ms_max": 0.0,
+    "run_ms_total": 0.0,
+}
+
+
+class LLMQueueFull(Exception):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+class Reservation:
+    """A request's admission to the LLM pool; run() its model calls, then release()."""
+
+    def __init__(self):
+        self._released = False
+        self._release_lock = threading.Lock()
+
+    def release(self):
+        """Give the slot back (idempotent)."""
+        with self._release_lock:
+            if self._released:
+                return
+            self._released = True
+        _count(active_requests=-1)
+        _slots.release()
+
+    async def run(self, fn, *args, **kwargs):
+        """Run a blocking inference call on the LLM pool and await its result."""
+        _count(submitted=1, queued=1)
+        call = functools.partial(_timed, functools.partial(fn, *args, **kwargs), time.perf_counter())
+        try:
+            future = _executor.submit(call)
+        except Exception:
+            _count(queued=-1)
+            raise
+        return await asyncio.wrap_future(future)
+
+
+def _count(**deltas):
+    with _lock:
+        for key, delta in deltas.items():
+            _stats[key] += delta
+
+
+def _timed(fn, submitted_at: float):
+    started = time.perf_counter()
+    wait_ms = (started - submitted_at) * 1000
+    with _lock:
+        _stats["queued"] -= 1
+        _stats["running"] += 1
+        _stats["wait_ms_total"] += wait_ms
+        _stats["wait_ms_max"] = max(_stats["wait_ms_max"], wait_ms)
+    ok = False
+    try:
+        result = fn()
+        ok = True
+        return result
+    finally:
+        _count(
+            running=-1,
+            completed=1 if ok else 0,
+            failed=0 if ok else 1,
+            run_ms_total=(time.perf_counter() - started) * 1000,
+        )
+
+
+def admit() -> Reservation:
+    """
+    Admit one generation request for all of its model calls; the caller
+    must release() it. For requests that outlive a with-block, such as a
+    streaming response. Raises LLMQueueFull immediately if the pool is saturated.
+    """
+    if not _slots.acquire(blocking=False):
+        _count(rejected=1)
+        raise LLMQueueFull("Question generation is busy, try again shortly")
+    _count(admitted=1, active_requests=1)
+    return Reservation()
+
+
+@contextmanager
+def reserve():
+    """
+    admit() scoped to a block:
+        with llm_executor.reserve() as llm:
+            mcqs = await llm.run(generate_mcqs_phi3, ...)
+    """
+    llm = admit()
+    try:
+        yield llm
+    finally:
+        llm.release()
+
+
+def queue_stats() -> dict:
+    """Queue depth, throughput counters and wait/run times of the LLM pool."""
+    with _lock:
+        started = _stats["completed"] + _stats["failed"] + _stats["running"]
+        finished = _stats["completed"] + _stats["failed"]
+        return {
+            "workers": LLM_WORKERS,
+            "queue_capacity": LLM_QUEUE_SIZE,
+            "active_requests": _stats["active_requests"],
+            "admitted": _stats["admitted"],
+            "rejected": _stats["rejected"],
+            "queued": _stats["queued"],
+            "running": _stats["running"],
+            "submitted": _stats["submitted"],
+            "completed": _stats["completed"],
+            "failed": _stats["failed"],
+            "avg_wait_ms": round(_stats["wait_ms_total"] / started, 1) if started else 0.0,
+            "max_wait_ms": round(_stats["wait_ms_max"], 1),
+            "avg_run_ms": round(_stats["run_ms_total"] / finished, 1) if finished else 0.0,
+        }
@@ -0,0 +1,149 @@
+from contextlib import contextmanager
+from api.services.llm_prefix_cache import PrefixCache
+from api.services.mcq_grammar import mcq_grammar_text
+import os
+import queue
+import threading
+import time
+
+# Pool of llama.cpp model instances sharing the machine's cores.
+# One Llama object is not thread-safe and a single instance given every
+# core scales poorly, so the cores are split into slices and each instance
+# gets one (n_threads = slice size; with pin_cores the calling thread is
+# pinned to the slice, which llama.cpp's worker threads inherit).
+# Instances are handed out by a FIFO free list: a caller waits for the
+# first instance to come free, and waiting callers are served in arrival
+# order. Generation requests issue one model call at a time, so concurrent
+# requests interleave call by call instead of one monopolizing the pool.
+# Weights are memory-mapped, so instances share them; each adds its own
+# KV cache. The prefix-cache budget is for the whole pool and is split
+# evenly between the instances.
+
+
+def _available_cores() -> list[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class ModelInstance:
+    def __init__(self, index: int, cores: list[int], loader, prefix_cache_mb: float):
+        self.index = index
+        self.cores = cores
+        self.model = None
+        self.prefix_cache: PrefixCache | None = None
+        self.calls = 0
+        self.busy_secs = 0.0
+        self._loader = loader
+        self._prefix_cache_mb = prefix_cache_mb
+        self._grammars = {}
+
+    def load(self):
+        """Load the model on first use (callers hold the instance)."""
+        if self.model is None:
+            self.model = self._loader(n_threads=len(self.cores))
+            if self._prefix_cache_mb > 0:
+                self.prefix_cache = PrefixCache(self.model, self._prefix_cache_mb)
+        return self.model
+
+    def grammar(self, count: int):
+        """Compiled MCQ grammar; per instance because grammars carry parse state."""
+        if count not in self._grammars:
+            from llama_cpp import LlamaGrammar
+            self._grammars[count] = LlamaGrammar.from_string(mcq_grammar_text(count), verbose=False)
+        return self._grammars[count]
+
+
+class ModelPool:
+    def __init__(self, loader, instances: int, threads_per_instance: int = 0,
+                 pin_cores: bool = True, prefix_cache_mb: int = 0):
+        cores = _available_cores()
+        instances = max(1, min(instances, len(cores)))
+        per = threads_per_instance or max(1, len(cores) // instances)
+        prefix_cache_mb_each = prefix_cache_mb / instances
+        self.pin_cores = pin_cores and hasattr(os, "sched_setaffinity")
+        self.instances = [
+            ModelInstance(
+                i,
+                [cores[(i * per + j) % len(cores)] for j in range(per)],
+                loader,
+                prefix_cache_mb_each,
+            )
+            for i in range(instances)
+        ]
+        self._free: queue.Queue[ModelInstance] = queue.Queue()
+        for inst in self.instances:
+            self._free.put(inst)
+        self._lock = threading.Lock()
+        self._waits = {"acquired": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+
+    @contextmanager
+    def acquire(self):
+        """
+        Hold a free instance (loaded, thread pinned to its cores) for one
+        call; the thread's previous affinity is restored on release.
+        """
+        t0 = time.perf_counter()
+        inst = self._free.get()
+        wait_ms = (time.perf_counter() - t0) * 1000
+        with self._lock:
+            self._waits["acquired"] += 1
+            self._waits["wait_ms_total"] += wait_ms
+            self._waits["wait_ms_max"] = max(self._waits["wait_ms_max"], wait_ms)
+
+        started = time.perf_counter()
+        # Pinning applies to the calling thread; undo it so a pooled thread
+        # does not keep this instance's core set for its next task
+        previous_cores = os.sched_getaffinity(0) if self.pin_cores else None
+        try:
+            if self.pin_cores:
+                os.sched_setaffinity(0, inst.cores)
+            inst.load()
+            yield inst
+        finally:
+            if previous_cores is not None:
+                os.sched_setaffinity(0, previous_cores)
+            inst.calls += 1
+            inst.busy_secs += time.perf_counter() - started
+            self._free.put(inst)
+
+    def load_all(self):
+        """Load every instance up front (warm-up and benchmarks)."""
+        for _ in self.instances:
+            with self.acquire():
+                pass
+
+    def prefix_cache_stats(self) -> dict:
+        """PrefixCache counters summed over the loaded instances."""
+        caches = [inst.prefix_cache.stats() for inst in self.instances if inst.prefix_cache]
+        if not caches:
+            return {"enabled": False}
+        total = {key: sum(c[key] for c in caches) for key in caches[0] if key != "hit_rate"}
+        hits = total["warm_hits"] + total["restored_hits"]
+        total["hit_rate"] = round(hits / total["lookups"], 4) if total["lookups"] else 0.0
+        total["prefill_ms"] = round(total["prefill_ms"], 1)
+        return {"enabled": True, **total}
+
+    def stats(self) -> dict:
+        with self._lock:
+            acquired = self._waits["acquired"]
+            waits = {
+                "acquired": acquired,
+                "avg_wait_ms": round(self._waits["wait_ms_total"] / acquired, 1) if acquired else 0.0,
+                "max_wait_ms": round(self._waits["wait_ms_max"], 1),
+            }
+        return {
+            "instances": [
+                {
+                    "index": inst.index,
+                    "threads": len(inst.cores),
+                    "cores": inst.cores if self.pin_cores else None,
+                    "loaded": inst.model is not None,
+                    "calls": inst.calls,
+                    "busy_secs": round(inst.busy_secs, 1),
+                }
+                for inst in self.instances
+            ],
+            "free": self._free.qsize(),
+            **waits,
+        }
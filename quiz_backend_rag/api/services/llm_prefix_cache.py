@@ -0,0 +1,124 @@
+from collections import OrderedDict
+import threading
+import time
+
+# KV-state reuse for shared prompt prefixes of a llama.cpp model.
+# MCQ prompts start with the same system block followed by one of a handful
+# of retrieved chunks, so the prefix "system + chunk" repeats across calls.
+# Before a completion the prefix is made resident in the model's KV cache:
+#   warm      the model's last evaluated tokens already start with it
+#   restored  its saved state is loaded (no prefill at all)
+#   miss      only the part after the longest already-evaluated prefix is
+#             evaluated (the system block is normally reused), then the
+#             state is saved, LRU-evicted by capacity_mb (counting the
+#             logits and token ids a LlamaState copies, not just the KV blob)
+# The completion call then only prefills the short task suffix, because
+# Llama.generate skips tokens that match its evaluated prefix.
+
+
+def _common_prefix(a, b) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+def state_nbytes(state) -> int:
+    """
+    Memory held by a saved LlamaState: the llama.cpp state blob plus its
+    copies of scores (n_tokens x n_vocab float32 logits, by far the largest
+    part) and input_ids.
+    """
+    size = state.llama_state_size
+    for name in ("scores", "input_ids"):
+        array = getattr(state, name, None)
+        if array is not None:
+            size += array.nbytes
+    return size
+
+
+class PrefixCache:
+    def __init__(self, model, capacity_mb: float):
+        self.model = model
+        self.capacity = int(capacity_mb * 1024 * 1024)
+        self._states: OrderedDict[tuple, tuple[object, int]] = OrderedDict()  # tokens -> (state, bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "warm_hits": 0,
+            "restored_hits": 0,
+            "misses": 0,
+            "tokens_reused": 0,
+            "tokens_prefilled": 0,
+            "prefill_ms": 0.0,
+        }
+
+    def tokenize(self, text: str) -> list[int]:
+        return self.model.tokenize(text.encode("utf-8"), special=True)
+
+    def prime(self, prefix: str) -> int:
+        """
+        Make the model's KV cache hold `prefix`; returns the number of prefix
+        tokens that did not need evaluating. Callers must hold the model.
+        """
+        tokens = self.tokenize(prefix)
+        key = tuple(tokens)
+        evaluated = self.model._input_ids
+        common = _common_prefix(evaluated, tokens)
+
+        with self._lock:
+            if common == len(tokens):
+                self._stats["warm_hits"] += 1
+                self._stats["tokens_reused"] += len(tokens)
+                return len(tokens)
+            entry = self._states.get(key)
+            state = entry[0] if entry is not None else None
+            if entry is not None:
+                self._states.move_to_end(key)
+
+        if state is not None:
+            self.model.load_state(state)
+            with self._lock:
+                self._stats["restored_hits"] += 1
+                self._stats["tokens_reused"] += len(tokens)
+            return len(tokens)
+
+        started = time.perf_counter()
+        # Same truncation Llama.generate does before evaluating a new prompt
+        self.model.n_tokens = common
+        self.model.eval(tokens[common:])
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        state = self.model.save_state() if self.capacity else None
+
+        with self._lock:
+            self._stats["misses"] += 1
+            self._stats["tokens_reused"] += common
+            self._stats["tokens_prefilled"] += len(tokens) - common
+            self._stats["prefill_ms"] += elapsed_ms
+            size = state_nbytes(state) if state is not None else 0
+            if state is not None and size <= self.capacity:
+                old = self._states.pop(key, None)
+                if old is not None:
+                    self._bytes -= old[1]
+                self._states[key] = (state, size)
+                self._bytes += size
+                while self._bytes > self.capacity:
+                    _, (_, old_size) = self._states.popitem(last=False)
+                    self._bytes -= old_size
+        return common
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self._stats["warm_hits"] + self._stats["restored_hits"]
+            lookups = hits + self._stats["misses"]
+            return {
+                **self._stats,
+                "prefill_ms": round(self._stats["prefill_ms"], 1),
+                "lookups": lookups,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._states),
+                "bytes": self._bytes,
+                "capacity_bytes": self.capacity,
+            }
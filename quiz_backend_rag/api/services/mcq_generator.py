@@ -1,38 +1,60 @@
 import json
 import re
 from typing import List, Dict, Optional
-from llama_cpp import Llama
-from api.config import PHI3_MODEL_PATH
+from api.config import (
+    PHI3_MODEL_PATH, MCQ_PER_CALL, MCQ_GRAMMAR,
+    LLM_PREFIX_CACHE_MB, LLM_INSTANCES, LLM_THREADS_PER_INSTANCE, LLM_PIN_CORES,
+)
+from api.services.llm_pool import ModelPool
 import os
 import multiprocessing
+import threading
 
 # Adjust path relative to where execution happens or absolute path
 MODEL_PATH = PHI3_MODEL_PATH
 
-_phi3_model = None
+_model_pool = None
+_pool_lock = threading.Lock()
 
-def get_phi3_model():
-    global _phi3_model
-    if _phi3_model is None:
-        if not os.path.exists(MODEL_PATH):
-            raise FileNotFoundError(f"Phi-3 model not found at {MODEL_PATH}")
-        print(f"Loading Phi-3 model from {MODEL_PATH}...")
-        
-        # Performance Optimization from User
-        try:
-            _phi3_model = Llama(
-                model_path=MODEL_PATH,
-                n_ctx=1024, # Adequate and fast context
-                n_threads=multiprocessing.cpu_count(), # Use all CPU threads
-                n_batch=512, # Critical for speed
-                verbose=False,
-                temperature=0.1 # More consistent JSON generation
-            )
-        except Exception as e:
-            print(f"Failed to load model: {e}")
-            raise e
-            
-    return _phi3_model
+_stats_lock = threading.Lock()
+_gen_stats = {"calls": 0, "json_valid": 0, "mcqs_requested": 0, "mcqs_valid": 0, "retries": 0}
+
+def load_phi3_model(n_threads: int = multiprocessing.cpu_count()):
+    """Loads one Phi-3 llama.cpp instance using n_threads CPU threads."""
+    if not os.path.exists(MODEL_PATH):
+        raise FileNotFoundError(f"Phi-3 model not found at {MODEL_PATH}")
+    print(f"Loading Phi-3 model from {MODEL_PATH} ({n_threads} threads)...")
+    # Imported here so importing the API does not load llama.cpp
+    from llama_cpp import Llama
+    
+    # Performance Optimization from User
+    try:
+        return Llama(
+            model_path=MODEL_PATH,
+            n_ctx=1024, # Adequate and fast context
+            n_threads=n_threads, # This instance's slice of the CPU threads
+            n_batch=512, # Critical for speed
+            verbose=False,
+            temperature=0.1 # More consistent JSON generation
+        )
+    except Exception as e:
+        print(f"Failed to load model: {e}")
+        raise e
+
+def get_model_pool() -> ModelPool:
+    """The shared pool of LLM_INSTANCES Phi-3 instances (loaded on first use)."""
+    global _model_pool
+    if _model_pool is None:
+        with _pool_lock:
+            if _model_pool is None:
+                _model_pool = ModelPool(
+                    load_phi3_model,
+                    instances=LLM_INSTANCES,
+                    threads_per_instance=LLM_THREADS_PER_INSTANCE,
+                    pin_cores=LLM_PIN_CORES,
+                    prefix_cache_mb=LLM_PREFIX_CACHE_MB,
+                )
+    return _model_pool
 
 def clean_json_output(text: str) -> str:
     """
@@ -44,18 +66,30 @@ def clean_json_output(text: str) -> str:
         return match.group(0)
     return text
 
-def build_prompt(lecture_chunk: str, difficulty: str) -> str:
+def build_prompt_prefix(lecture_chunk: str) -> str:
     """
-    Constructs a Phi-3 chat template prompt for MCQ generation.
+    Shared start of every MCQ prompt: the fixed system block, then the chunk.
+    Task wording that varies (count, difficulty) comes after it, so the KV
+    state of this prefix can be reused across calls (see llm_prefix_cache).
     """
     return f"""
 <|system|>
 You are an AI model that generates strictly valid JSON outputs for multiple-choice questions.
-Never include explanations or any text outside the JSON object.
+Never include explanations or any text outside the JSON.
 <|end|>
 
 <|user|>
-Generate one multiple-choice question (MCQ) from the given lecture text chunk.
+Lecture Chunk:
+{lecture_chunk}
+
+""".lstrip()
+
+def build_prompt(lecture_chunk: str, difficulty: str) -> str:
+    """
+    Constructs a Phi-3 chat template prompt for MCQ generation.
+    """
+    return build_prompt_prefix(lecture_chunk) + f"""
+Generate one multiple-choice question (MCQ) from the lecture text chunk above.
 
 Your output must be valid JSON with the following fields:
 - question
@@ -67,59 +101,193 @@ Your output must be valid JSON with the following fields:
 The MCQ must match the requested difficulty.
 Provide only the JSON object.
 
-Lecture Chunk:
-{lecture_chunk}
+Difficulty: {difficulty}
+<|end|>
+
+<|assistant|>
+""".lstrip("\n").rstrip()
+
+def build_batch_prompt(lecture_chunk: str, difficulty: str, count: int) -> str:
+    """
+    Phi-3 chat template prompt asking for `count` MCQs from one chunk as a
+    JSON array, so the chunk is prefilled once for several questions.
+    """
+    return build_prompt_prefix(lecture_chunk) + f"""
+Generate {count} different multiple-choice questions (MCQs) from the lecture text chunk above.
+
+Your output must be a valid JSON array of {count} objects, each with the following fields:
+- question
+- options (exactly 4 strings)
+- correct (index 0-3)
+- difficulty (Easy, Medium, Hard)
+- time_secs (integer)
+
+Every MCQ must match the requested difficulty and ask about a different point.
+Provide only the JSON array.
 
 Difficulty: {difficulty}
 <|end|>
 
 <|assistant|>
-""".strip()
+""".lstrip("\n").rstrip()
+
+def _complete(context_chunk: str, prompt: str, max_tokens: int, count: int = 1) -> Optional[str]:
+    """
+    Runs one completion on a free pool instance, with the prompt's system +
+    chunk prefix served from that instance's KV prefix cache so only the
+    task suffix is prefilled. With MCQ_GRAMMAR the output is constrained to
+    `count` MCQs (see mcq_grammar). For count > 1, max_tokens is capped to
+    what the context window leaves after the prompt; returns None if that is
+    too little for a useful answer.
+    """
+    with get_model_pool().acquire() as inst:
+        model = inst.model
+        if count > 1:
+            prompt_tokens = len(model.tokenize(prompt.encode("utf-8"), special=True))
+            max_tokens = min(max_tokens, model.n_ctx() - prompt_tokens)
+            if max_tokens < 128:
+                return None
+        if inst.prefix_cache is not None:
+            inst.prefix_cache.prime(build_prompt_prefix(context_chunk))
+        response = model(
+            prompt,
+            max_tokens=max_tokens,
+            stop=["<|end|>"],
+            echo=False,
+            grammar=inst.grammar(count) if MCQ_GRAMMAR else None
+        )
+    _record(calls=1, mcqs_requested=count)
+    return response['choices'][0]['text'].strip()
+
+def _record(**deltas):
+    with _stats_lock:
+        for key, delta in deltas.items():
+            _gen_stats[key] += delta
+
+def record_retry():
+    """Counts a generation call of the quiz service that yielded no new MCQ."""
+    _record(retries=1)
+
+def generation_stats() -> dict:
+    """JSON validity and retry counters, to compare MCQ_GRAMMAR on and off."""
+    with _stats_lock:
+        calls = _gen_stats["calls"]
+        requested = _gen_stats["mcqs_requested"]
+        return {
+            **_gen_stats,
+            "grammar": MCQ_GRAMMAR,
+            "json_valid_rate": round(_gen_stats["json_valid"] / calls, 4) if calls else 0.0,
+            "mcq_valid_rate": round(_gen_stats["mcqs_valid"] / requested, 4) if requested else 0.0,
+        }
+
+def prompt_cache_stats() -> dict:
+    """Hit rate and prefill savings of the KV prefix caches."""
+    if _model_pool is None:
+        return {"enabled": LLM_PREFIX_CACHE_MB > 0, "lookups": 0}
+    return _model_pool.prefix_cache_stats()
+
+def pool_stats() -> dict:
+    """Instances, their core slices and utilization."""
+    if _model_pool is None:
+        return {"instances": [], "configured_instances": LLM_INSTANCES}
+    return _model_pool.stats()
+
+def validate_mcq(data) -> Optional[Dict]:
+    """
+    Checks one parsed MCQ and converts it to the service format
+    (options A-D dict, correct as a letter). Returns None if unusable.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("question"), str) or not data["question"].strip():
+        return None
+    opts = data.get("options")
+    if not isinstance(opts, list) or len(opts) != 4:
+        return None
+
+    # Map index to letter
+    idx = data.get("correct")
+    if isinstance(idx, int) and 0 <= idx <= 3:
+        data["correct"] = chr(65 + idx) # 0->A, 1->B...
+
+    # Convert list to dict for service compatibility
+    data["options"] = {
+        "A": opts[0],
+        "B": opts[1],
+        "C": opts[2],
+        "D": opts[3]
+    }
+    return data
+
+def parse_mcq_array(text: str) -> List[Dict]:
+    """
+    Extracts every valid MCQ object from model output that should be a JSON
+    array. Items are decoded one by one, so a malformed or truncated item
+    (e.g. cut off by max_tokens) only loses itself, not the whole batch.
+    """
+    decoder = json.JSONDecoder()
+    items = []
+    pos = text.find("{")
+    while pos != -1:
+        try:
+            obj, end = decoder.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            pos = text.find("{", pos + 1)
+            continue
+        mcq = validate_mcq(obj)
+        if mcq:
+            items.append(mcq)
+        pos = text.find("{", end)
+    return items
 
 def generate_mcq_phi3(context_chunk: str, difficulty: str = "Medium") -> Optional[Dict]:
     """
     Generates a single MCQ using the Phi-3 model.
     """
-    model = get_phi3_model()
-    
     prompt = build_prompt(context_chunk, difficulty)
     
-    response = model(
-        prompt,
-        max_tokens=256,
-        stop=["<|end|>"],
-        echo=False
-    )
-    
-    output_text = response['choices'][0]['text'].strip()
+    output_text = _complete(context_chunk, prompt, max_tokens=256)
     
     # Try to parse JSON
     try:
         json_str = clean_json_output(output_text)
         data = json.loads(json_str)
+        _record(json_valid=1)
         
         # Validation
-        if "options" in data and isinstance(data["options"], list) and len(data["options"]) == 4:
-            # Map index correct to A,B,C,D if needed or keep as index
-            
-            # Map index to letter
-            idx = data.get("correct")
-            if isinstance(idx, int) and 0 <= idx <= 3:
-                data["correct"] = chr(65 + idx) # 0->A, 1->B...
-            
-            # Convert list to dict for service compatibility
-            opts = data["options"]
-            data["options"] = {
-                "A": opts[0],
-                "B": opts[1],
-                "C": opts[2],
-                "D": opts[3]
-            }
-            
-            return data
+        mcq = validate_mcq(data)
+        if mcq:
+            _record(mcqs_valid=1)
+            return mcq
     except json.JSONDecodeError:
         print(f"Failed to parse JSON: {output_text}")
     except Exception as e:
         print(f"Error processing output: {e}")
         
     return None
+
+def generate_mcqs_phi3(context_chunk: str, difficulty: str = "Medium", count: int = MCQ_PER_CALL) -> List[Dict]:
+    """
+    Generates up to `count` MCQs from one chunk in a single Phi-3 call.
+    Each array item is validated on its own; invalid ones are dropped.
+    """
+    if count <= 1:
+        mcq = generate_mcq_phi3(context_chunk, difficulty)
+        return [mcq] if mcq else []
+
+    prompt = build_batch_prompt(context_chunk, difficulty, count)
+
+    # Up to ~256 tokens per MCQ, within what the prompt leaves of the context
+    output_text = _complete(context_chunk, prompt, max_tokens=256 * count, count=count)
+    if output_text is None:
+        mcq = generate_mcq_phi3(context_chunk, difficulty)
+        return [mcq] if mcq else []
+
+    try:
+        json.loads(output_text)
+        _record(json_valid=1)
+    except json.JSONDecodeError:
+        pass
+    mcqs = parse_mcq_array(output_text)[:count]
+    _record(mcqs_valid=len(mcqs))
+    if not mcqs:
+        print(f"Failed to parse JSON array: {output_text}")
+    return mcqs
@@ -0,0 +1,24 @@
+# GBNF grammars for llama.cpp constrained decoding of MCQs.
+# Sampling is restricted to tokens that keep the output inside the MCQ
+# shape: a question, exactly four options, correct index 0-3, a difficulty
+# from the enum and integer time_secs. Every completion that is not cut
+# off by max_tokens therefore parses and validates.
+
+_RULES = r'''
+mcq ::= "{" ws "\"question\"" ws ":" ws string ws "," ws "\"options\"" ws ":" ws options ws "," ws "\"correct\"" ws ":" ws [0-3] ws "," ws "\"difficulty\"" ws ":" ws difficulty ws "," ws "\"time_secs\"" ws ":" ws secs ws "}"
+options ::= "[" ws string ws "," ws string ws "," ws string ws "," ws string ws "]"
+difficulty ::= "\"Easy\"" | "\"Medium\"" | "\"Hard\""
+secs ::= [1-9] [0-9]? [0-9]?
+string ::= "\"" char char* "\""
+char ::= [^"\\\x00-\x1F] | "\\" (["\\/bfnrt] | "u" [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F])
+ws ::= [ \n]? [ \n]?
+'''
+
+
+def mcq_grammar_text(count: int = 1) -> str:
+    """GBNF for one MCQ object (count=1) or a JSON array of exactly count MCQs."""
+    if count <= 1:
+        return "root ::= mcq" + _RULES
+    items = ' ws "," ws mcq' * (count - 1)
+    return f'root ::= "[" ws mcq{items} ws "]"' + _RULES
+
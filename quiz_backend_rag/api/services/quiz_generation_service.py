@@ -1,14 +1,18 @@
 
 from sqlalchemy.orm import Session
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
 from api.models.quizzes import Quiz
 from api.models.quiz_questions import QuizQuestion
 from api.models.lecture_notes import LectureNote
 from api.models.question_library import QuestionLibrary
 from api.services.search_service import search_lecture_chunks
-from api.services.mcq_generator import generate_mcq_phi3
+from api.services.mcq_generator import generate_mcqs_phi3, record_retry
+from api.config import MCQ_PER_CALL
+from api.services import llm_executor
 from datetime import datetime
 import asyncio
+import time
 
 async def generate_quiz(
     db: Session,
@@ -29,7 +33,8 @@ async def generate_quiz(
         selected_library_question_ids=selected_library_question_ids
     )
 
-    return finalize_quiz(
+    return await run_in_threadpool(
+         finalize_quiz,
          db=db,
          lecture_note_id=lecture_note_id,
          topic=topic,
@@ -46,6 +51,41 @@ async def generate_questions_preview(
     difficulty_dict: dict[str, int] = None,
     selected_library_question_ids: list[int] = []
 ):
+    # DB queries, query embedding and index builds block: keep them off the event loop
+    plan = await run_in_threadpool(
+        prepare_preview,
+        db=db,
+        lecture_note_id=lecture_note_id,
+        topic=topic,
+        difficulty=difficulty,
+        num_questions=num_questions,
+        difficulty_dict=difficulty_dict,
+        selected_library_question_ids=selected_library_question_ids
+    )
+
+    generated_questions = [
+        event["question"] async for event in iter_preview_events(plan) if event["event"] == "question"
+    ]
+                
+    if not generated_questions:
+        raise HTTPException(status_code=500, detail="Failed to generate any questions.")
+        
+    return generated_questions
+
+def prepare_preview(
+    db: Session,
+    lecture_note_id: int,
+    topic: str,
+    difficulty: str,
+    num_questions: int,
+    difficulty_dict: dict[str, int] = None,
+    selected_library_question_ids: list[int] = []
+) -> dict:
+    """
+    Retrieval and planning part of preview generation (no LLM calls).
+    Raises HTTPException up front so streaming endpoints can still answer
+    with a plain error status.
+    """
 
     # 1. Fetch Lecture Note
     note = db.query(LectureNote).get(lecture_note_id)
@@ -69,7 +109,7 @@ async def generate_questions_preview(
     else:
         target_counts = {difficulty: num_questions}
 
-    generated_questions = []
+    library_questions = []
 
     # 4. Fetch Selected Library Questions
     if selected_library_question_ids:
@@ -87,13 +127,61 @@ async def generate_questions_preview(
                 "difficulty": lq.difficulty,
                 "time_secs": lq.time_secs or 60
             }
-            generated_questions.append(q_dict)
+            library_questions.append(q_dict)
+
+    return {
+        "chunk_texts": [chunk.text for chunk in top_chunks],
+        "target_counts": target_counts,
+        "num_questions": num_questions,
+        "library_questions": library_questions,
+    }
+
+async def iter_preview_events(plan: dict, first_call_count: int = MCQ_PER_CALL,
+                              llm: llm_executor.Reservation | None = None):
+    """
+    Runs the generation loop of a prepared preview, yielding progress events:
+      {"event": "retrieval", ...}   once, context and library questions ready
+      {"event": "question", ...}    each library or newly validated MCQ
+      {"event": "retry", ...}       a model call that yielded no new MCQ
+      {"event": "done", ...}        summary
+    first_call_count caps the first model call (1 gives the fastest first question).
+    The request holds one LLM pool reservation for all of its model calls,
+    so it either fails with LLMQueueFull before any event or runs to the end.
+    Pass llm to use a reservation the caller already holds (and releases).
+    """
+    if llm is not None:
+        async for event in _preview_events(plan, llm, first_call_count):
+            yield event
+        return
+    with llm_executor.reserve() as llm:
+        async for event in _preview_events(plan, llm, first_call_count):
+            yield event
+
+async def _preview_events(plan: dict, llm, first_call_count: int):
+    started = time.perf_counter()
+    chunk_texts = plan["chunk_texts"]
+    total = plan["num_questions"]
+    generated_questions = []
+    total_retries = 0
+
+    yield {
+        "event": "retrieval",
+        "chunks": len(chunk_texts),
+        "library_questions": len(plan["library_questions"]),
+        "total": total,
+    }
+
+    for q_dict in plan["library_questions"]:
+        generated_questions.append(q_dict)
+        yield {"event": "question", "index": len(generated_questions), "total": total,
+               "source": "library", "question": q_dict}
 
     # 5. Generate Loop
     chunk_index = 0
     max_retries = 3
+    calls = 0
     
-    for diff_level, count in target_counts.items():
+    for diff_level, count in plan["target_counts"].items():
         # Count how many we already have of this difficulty from library selection
         # (This is a refinement: if user selected 3 Easy from library, and wants 5 Easy total, we only generate 2)
         # However, the previous logic just APPENDED library questions. 
@@ -113,27 +201,47 @@ async def generate_questions_preview(
         
         while current_generated_for_diff < needed and retries < max_retries * needed:
             # Rotate chunks
-            chunk = top_chunks[chunk_index % len(top_chunks)]
-            chunk_text = chunk.text
+            chunk_text = chunk_texts[chunk_index % len(chunk_texts)]
+            per_call = first_call_count if calls == 0 else MCQ_PER_CALL
+            calls += 1
             
-            # Generate
-            mcq = generate_mcq_phi3(context_chunk=chunk_text, difficulty=diff_level)
+            # Generate several MCQs per call on the LLM pool (event loop stays free)
+            mcqs = await llm.run(
+                generate_mcqs_phi3,
+                context_chunk=chunk_text,
+                difficulty=diff_level,
+                count=min(per_call, needed - current_generated_for_diff),
+            )
             
-            if mcq:
+            added = 0
+            for mcq in mcqs:
+                if current_generated_for_diff >= needed:
+                    break
                 # Check duplicates
                 if not any(q['question'] == mcq['question'] for q in generated_questions):
                     generated_questions.append(mcq)
                     current_generated_for_diff += 1
-                    chunk_index += 1
-                else:
-                    retries += 1
+                    added += 1
+                    yield {"event": "question", "index": len(generated_questions), "total": total,
+                           "source": "generated", "question": mcq}
+            if added:
+                chunk_index += 1
             else:
                 retries += 1
-                
-    if not generated_questions:
-        raise HTTPException(status_code=500, detail="Failed to generate any questions.")
-        
-    return generated_questions
+                total_retries += 1
+                record_retry()
+                yield {"event": "retry", "difficulty": diff_level, "retries": retries,
+                       "max_retries": max_retries * needed}
+
+    yield {
+        "event": "done",
+        "questions": len(generated_questions),
+        "generated": len(generated_questions) - len(plan["library_questions"]),
+        "total": total,
+        "model_calls": calls,
+        "retries": total_retries,
+        "elapsed_secs": round(time.perf_counter() - started, 2),
+    }
 
 def finalize_quiz(
     db: Session,
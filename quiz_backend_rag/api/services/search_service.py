@@ -1,15 +1,24 @@
 
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, load_only
 from api.models.chunks import Chunk
 from api.models.lecture_notes import LectureNote
-from api.utils.embedding_utils import generate_embedding
+from api.utils.query_cache import embed_query, embed_queries
+from api.utils.keyword_utils import tokenize
+from api.utils.vector_codec import decode_vector
+from api.services.vector_index_cache import get_note_index
+from api.services import bm25_index
+from api.config import SEARCH_MODE, SEARCH_MODES
 import numpy as np
 
+RRF_K = 60
+HYBRID_CANDIDATES = 50  # depth of each ranking fed into the fusion
+
 def bytes_to_vector(blob: bytes) -> np.ndarray:
-    """Convert MySQL LONGBLOB back to numpy float32 vector."""
-    if not blob:
-        return np.array([])
-    return np.frombuffer(blob, dtype=np.float32)
+    """
+    Convert MySQL LONGBLOB back to numpy float32 vector.
+    Handles legacy raw float32 blobs and compact float16/int8 blobs.
+    """
+    return decode_vector(blob)
 
 def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
     """Compute cosine similarity between two vectors."""
@@ -21,36 +30,239 @@ def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
         return 0.0
     return float(np.dot(a, b) / (norm_a * norm_b))
 
-def search_lecture_chunks(db: Session, lecture_note_id: int, query: str, top_k: int = 6):
+def note_keyword_rows(db: Session, lecture_note_id: int) -> list:
+    """(id, keywords) of every chunk of a note, without text or embeddings."""
+    return db.query(Chunk.id, Chunk.keywords).filter(Chunk.lecture_notes_id == lecture_note_id).all()
+
+def keyword_prefilter_ids(db: Session, lecture_note_id: int, query: str, min_candidates: int,
+                          rows: list | None = None) -> np.ndarray | None:
     """
-    Performs vector search on chunks identified by lecture_note_id.
-    Returns top_k chunks sorted by similarity.
+    Ids of the note's chunks whose stored keywords share a term with the query.
+    Returns None (score everything) when fewer than min_candidates match or
+    no keywords are stored yet, so recall never drops below top_k.
+    rows may pass note_keyword_rows() already fetched for another query.
     """
-    # Generate embedding for the query
-    query_bytes = generate_embedding(query)
-    if not query_bytes:
-        return []
-    
-    query_vec = np.frombuffer(query_bytes, dtype=np.float32)
+    query_terms = set(tokenize(query))
+    if not query_terms:
+        return None
+    if rows is None:
+        rows = note_keyword_rows(db, lecture_note_id)
+    matched = [row.id for row in rows if row.keywords and query_terms.intersection(row.keywords)]
+    return np.asarray(matched, dtype=np.int64) if len(matched) >= min_candidates else None
 
-    # Fetch chunks
-    chunks = db.query(Chunk).filter(Chunk.lecture_notes_id == lecture_note_id).all()
-    if not chunks:
-        return []
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first (argpartition + sort of k)."""
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.size:
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(scores.size)
+    return idx[np.argsort(-scores[idx], kind="stable")]
 
-    similarities = []
-    
-    for chunk in chunks:
-        if not chunk.embedding:
-            continue
-        
-        chunk_vec = bytes_to_vector(chunk.embedding)
-        sim = cosine_similarity(query_vec, chunk_vec)
+def load_chunks_by_ids(db: Session, chunk_ids) -> dict:
+    """
+    Fetch the Chunk rows of the given ids (the search winners) with one IN
+    query, keyed by id. Only id, note, chunk_index and text are selected;
+    keywords and the embedding blob stay unloaded.
+    """
+    ids = [int(i) for i in chunk_ids]
+    if not ids:
+        return {}
+    columns = [Chunk.id, Chunk.lecture_notes_id, Chunk.chunk_index, Chunk.text]
+    query = db.query(Chunk).options(load_only(*columns)).filter(Chunk.id.in_(ids))
+    return {c.id: c for c in query.all()}
+
+def _vector_rankings(db: Session, lecture_note_id: int, queries: list[str], query_mat: np.ndarray,
+                     n_candidates: int, use_keyword_prefilter: bool) -> list[list[tuple[int, float]]]:
+    """
+    Top n_candidates (chunk_id, cosine) pairs per query from the note's
+    vector index; queries are scored against the stored vectors, a block
+    of rows at a time for compact (float16/int8) storage. Queries without
+    a keyword prefilter share one matrix-matrix product; a prefiltered
+    query is scored against its candidate rows only.
+    """
+    index = get_note_index(db, lecture_note_id)
+    if index.ids.size == 0:
+        return [[] for _ in queries]
+
+    allowed: list[np.ndarray | None] = [None] * len(queries)
+    if use_keyword_prefilter:
+        keyword_rows = note_keyword_rows(db, lecture_note_id)
+        allowed = [
+            keyword_prefilter_ids(db, lecture_note_id, query, n_candidates, rows=keyword_rows)
+            for query in queries
+        ]
+
+    def ranking(ids: np.ndarray, row_scores: np.ndarray) -> list[tuple[int, float]]:
+        return [(int(ids[i]), float(row_scores[i])) for i in top_k_indices(row_scores, n_candidates)]
+
+    rankings: list[list[tuple[int, float]]] = [[] for _ in queries]
+    unfiltered = [row for row, ids in enumerate(allowed) if ids is None]
+    if unfiltered:
+        scores = index.matrix.scores(query_mat[unfiltered])  # (queries, chunks)
+        for row, row_scores in zip(unfiltered, scores):
+            rankings[row] = ranking(index.ids, row_scores)
+    for row, ids in enumerate(allowed):
+        if ids is not None:
+            positions = np.flatnonzero(np.isin(index.ids, ids))
+            rankings[row] = ranking(index.ids[positions], index.matrix.scores(query_mat[row:row + 1], positions)[0])
+    return rankings
+
+def _vector_ranking(db: Session, lecture_note_id: int, query: str, query_vec: np.ndarray,
+                    n_candidates: int, use_keyword_prefilter: bool) -> list[tuple[int, float]]:
+    """Top n_candidates (chunk_id, cosine) pairs from the note's vector index."""
+    return _vector_rankings(
+        db, lecture_note_id, [query], query_vec[np.newaxis, :], n_candidates, use_keyword_prefilter
+    )[0]
+
+def _bm25_ranking(db: Session, lecture_note_id: int, query: str, n_candidates: int) -> list[tuple[int, float]]:
+    """Top n_candidates (chunk_id, bm25) pairs; chunks sharing no term are left out."""
+    index = bm25_index.get_note_index(db, lecture_note_id)
+    scores = index.score(query)
+    return [
+        (int(index.chunk_ids[i]), float(scores[i]))
+        for i in top_k_indices(scores, n_candidates)
+        if scores[i] > 0
+    ]
+
+def reciprocal_rank_fusion(rankings: list[list[tuple[int, float]]], k: int = RRF_K) -> list[tuple[int, float]]:
+    """Fuse ranked (id, score) lists: score(id) = sum 1 / (k + rank)."""
+    fused: dict[int, float] = {}
+    for ranking in rankings:
+        for rank, (chunk_id, _) in enumerate(ranking, start=1):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+def search_lecture_chunks_scored(
+    db: Session,
+    lecture_note_id: int,
+    query: str,
+    top_k: int = 6,
+    use_keyword_prefilter: bool = False,
+    mode: str = SEARCH_MODE,
+) -> list[tuple]:
+    """
+    Performs search on chunks identified by lecture_note_id.
+    Returns the top_k (chunk, score) pairs, best first. mode selects:
+    - "vector": cosine similarity against the note's cached embedding
+      matrix in its storage dtype (one product + argpartition);
+    - "bm25": BM25 over the note's inverted index (exact terms such as
+      System.out.println or no-arg);
+    - "hybrid": both rankings fused with reciprocal rank fusion (score is
+      the RRF score).
+    Only the winning rows are loaded from the DB.
+    With use_keyword_prefilter, only the chunks whose keywords overlap the
+    query are vector-scored, unless fewer than the candidates needed match
+    (see keyword_prefilter_ids).
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode: {mode}")
+
+    if mode == "bm25":
+        ranked = _bm25_ranking(db, lecture_note_id, query, top_k)
+    else:
+        # Generate embedding for the query (cached)
+        query_bytes = embed_query(query)
+        if not query_bytes:
+            return []
         
-        similarities.append((chunk, sim))
+        query_vec = np.frombuffer(query_bytes, dtype=np.float32)
+        query_norm = np.linalg.norm(query_vec)
+        if query_norm == 0:
+            return []
+        query_vec = query_vec / query_norm
 
-    # Sort by similarity desc
-    similarities.sort(key=lambda x: x[1], reverse=True)
-    
+        if mode == "hybrid":
+            n_candidates = max(top_k, HYBRID_CANDIDATES)
+            ranked = reciprocal_rank_fusion([
+                _vector_ranking(db, lecture_note_id, query, query_vec, n_candidates, use_keyword_prefilter),
+                _bm25_ranking(db, lecture_note_id, query, n_candidates),
+            ])[:top_k]
+        else:
+            ranked = _vector_ranking(db, lecture_note_id, query, query_vec, top_k, use_keyword_prefilter)
+
+    chunk_map = load_chunks_by_ids(db, [chunk_id for chunk_id, _ in ranked])
+    scored = [
+        (chunk_map[chunk_id], score)
+        for chunk_id, score in ranked
+        if chunk_id in chunk_map  # deleted since the index was built
+    ]
+    return scored[:top_k]
+
+def search_lecture_chunks(
+    db: Session,
+    lecture_note_id: int,
+    query: str,
+    top_k: int = 6,
+    use_keyword_prefilter: bool = False,
+    mode: str = SEARCH_MODE,
+):
+    """
+    Performs search on chunks identified by lecture_note_id.
+    Returns top_k chunks sorted by relevance (see search_lecture_chunks_scored).
+    """
+    scored = search_lecture_chunks_scored(
+        db, lecture_note_id, query, top_k=top_k, use_keyword_prefilter=use_keyword_prefilter, mode=mode
+    )
     # Return top K chunks (just the models)
-    return [item[0] for item in similarities[:top_k]]
+    return [chunk for chunk, _ in scored]
+
+def search_lecture_chunks_batch(
+    db: Session,
+    lecture_note_id: int,
+    queries: list[str],
+    top_k: int = 6,
+    use_keyword_prefilter: bool = False,
+    mode: str = SEARCH_MODE,
+) -> list[list[tuple]]:
+    """
+    search_lecture_chunks_scored for several queries at once.
+    Queries are embedded in one encoder batch (cache misses only). Those
+    not narrowed by use_keyword_prefilter are vector-scored with a single
+    matrix-matrix product against the note's matrix, prefiltered ones
+    against their candidate rows only; the winning chunks of all queries
+    are loaded with one IN query.
+    Returns one best-first list of (chunk, score) pairs per query.
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode: {mode}")
+
+    rankings: list[list[tuple[int, float]]] = [[] for _ in queries]
+    rows: list[int] = []  # positions of the queries that were vector-scored
+    query_mat = None
+
+    if mode == "bm25":
+        rankings = [_bm25_ranking(db, lecture_note_id, q, top_k) for q in queries]
+    else:
+        embedded = embed_queries(queries)
+        rows = [i for i, emb in enumerate(embedded) if emb is not None]
+        if rows:
+            query_mat = np.stack([np.frombuffer(embedded[i], dtype=np.float32) for i in rows])
+            norms = np.linalg.norm(query_mat, axis=1, keepdims=True)
+            keep = norms[:, 0] > 0
+            rows = [i for i, k in zip(rows, keep) if k]
+            query_mat = query_mat[keep] / norms[keep]
+
+        if rows:
+            n_candidates = max(top_k, HYBRID_CANDIDATES) if mode == "hybrid" else top_k
+            vector = _vector_rankings(
+                db, lecture_note_id, [queries[i] for i in rows], query_mat, n_candidates, use_keyword_prefilter
+            )
+            for i, ranking in zip(rows, vector):
+                if mode == "hybrid":
+                    ranking = reciprocal_rank_fusion([
+                        ranking, _bm25_ranking(db, lecture_note_id, queries[i], n_candidates),
+                    ])[:top_k]
+                rankings[i] = ranking
+
+    chunk_map = load_chunks_by_ids(db, {chunk_id for ranking in rankings for chunk_id, _ in ranking})
+    results = []
+    for ranking in rankings:
+        scored = [
+            (chunk_map[chunk_id], score)
+            for chunk_id, score in ranking
+            if chunk_id in chunk_map  # deleted since the index was built
+        ]
+        results.append(scored[:top_k])
+    return results
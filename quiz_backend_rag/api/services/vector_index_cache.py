@@ -0,0 +1,80 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from sqlalchemy.orm import Session
+from api.services.vector_store import get_vector_store
+from api.utils.vector_codec import CompactMatrix
+from api.config import VECTOR_CACHE_MAX_MB, VECTOR_CACHE_VALIDATE
+import numpy as np
+import threading
+
+# Process-level cache of per-note vector indexes.
+# Each entry holds the chunk ids and the embedding matrix of one lecture
+# note in its storage dtype (a CompactMatrix from the vector store), so hot notes
+# are searched without touching MySQL blobs. Entries are evicted LRU once VECTOR_CACHE_MAX_MB is exceeded
+# and must be invalidated by every code path that changes a note's chunks.
+
+
+@dataclass
+class NoteIndex:
+    lecture_note_id: int
+    ids: np.ndarray      # (n,) int64 chunk ids
+    matrix: CompactMatrix  # (n, dim) in the storage dtype, rows normalize on decode
+    signature: tuple
+
+    @property
+    def nbytes(self) -> int:
+        return self.ids.nbytes + self.matrix.nbytes
+
+
+_lock = threading.Lock()
+_cache: OrderedDict[int, NoteIndex] = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "bytes": 0}
+_max_bytes = VECTOR_CACHE_MAX_MB * 1024 * 1024
+
+
+def _build(db: Session, lecture_note_id: int, signature: tuple) -> NoteIndex:
+    ids, matrix = get_vector_store().load_note_compact(db, lecture_note_id)
+    return NoteIndex(lecture_note_id, ids, matrix, signature)
+
+
+def get_note_index(db: Session, lecture_note_id: int) -> NoteIndex:
+    """Return the cached index for a note, building it on a miss."""
+    signature = get_vector_store().signature(db, lecture_note_id) if VECTOR_CACHE_VALIDATE else None
+
+    with _lock:
+        index = _cache.get(lecture_note_id)
+        if index is not None and (signature is None or index.signature == signature):
+            _cache.move_to_end(lecture_note_id)
+            _stats["hits"] += 1
+            return index
+        _stats["misses"] += 1
+
+    index = _build(db, lecture_note_id, signature)
+
+    with _lock:
+        old = _cache.pop(lecture_note_id, None)
+        if old is not None:
+            _stats["bytes"] -= old.nbytes
+        if index.nbytes <= _max_bytes:
+            _cache[lecture_note_id] = index
+            _stats["bytes"] += index.nbytes
+            while _stats["bytes"] > _max_bytes:
+                _, evicted = _cache.popitem(last=False)
+                _stats["bytes"] -= evicted.nbytes
+                _stats["evictions"] += 1
+    return index
+
+
+def invalidate(*lecture_note_ids: int):
+    """Drop cached indexes of notes whose chunks changed."""
+    with _lock:
+        for note_id in lecture_note_ids:
+            old = _cache.pop(note_id, None)
+            if old is not None:
+                _stats["bytes"] -= old.nbytes
+                _stats["invalidations"] += 1
+
+
+def cache_stats() -> dict:
+    with _lock:
+        return {**_stats, "entries": len(_cache), "max_bytes": _max_bytes}
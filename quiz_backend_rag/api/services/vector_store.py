@@ -0,0 +1,237 @@
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from api.models.chunks import Chunk
+from api.models.lecture_notes import LectureNote
+from api.utils.embedding_utils import encode_texts
+from api.utils.file_lock import file_lock
+from api.utils.vector_codec import encode_vector, decode_matrix, decode_compact, normalize_rows, CompactMatrix
+from api.config import VECTOR_STORE, VECTOR_STORE_DIR, EMBEDDING_STORAGE_DTYPE, EMBED_BATCH_SIZE
+import numpy as np
+import threading
+import os
+
+# Pluggable storage for chunk vectors.
+#
+# mysql (default): vectors live in Chunk.embedding (see vector_codec).
+# mmap: MySQL keeps only text/metadata (embedding stays NULL); each note's
+#   normalized float32 vectors live in VECTOR_STORE_DIR/note_<id>.npy as a
+#   structured array (id int64, vec float32[dim]) that readers open with
+#   mmap_mode="r", so uvicorn workers share the OS page cache with no copies.
+#   Files are replaced atomically on write; updates (read, merge, write) hold
+#   a per-note file lock so concurrent workers do not lose each other's writes.
+
+
+class VectorStore:
+    name = "base"
+    external = False  # True when vectors are not kept in Chunk.embedding
+
+    def embed_texts(self, texts: list[str], batch_size: int = EMBED_BATCH_SIZE):
+        """
+        Encode texts for storage.
+        Returns (row_blobs, positions, vectors): the value for each row's
+        Chunk.embedding column, the indexes of the texts that were embedded
+        (non-empty), and their float32 vectors.
+        """
+        positions = [i for i, t in enumerate(texts) if t and t.strip()]
+        vectors = (
+            encode_texts([texts[i] for i in positions], batch_size=batch_size)
+            if positions else np.zeros((0, 0), dtype=np.float32)
+        )
+        blobs: list[bytes | None] = [None] * len(texts)
+        if not self.external:
+            for pos, vec in zip(positions, vectors):
+                blobs[pos] = encode_vector(vec, EMBEDDING_STORAGE_DTYPE)
+        return blobs, positions, vectors
+
+    def add(self, lecture_note_id: int, chunk_ids: np.ndarray, vectors: np.ndarray):
+        """Store vectors for (already inserted) chunks; replaces existing ids."""
+
+    def remove(self, lecture_note_id: int, chunk_ids=None):
+        """Forget vectors of some chunks of a note (all of them if chunk_ids is None)."""
+
+    def contains(self, db: Session, lecture_note_id: int, chunk_ids: list[int]) -> np.ndarray:
+        """Boolean mask: which of chunk_ids have a stored vector."""
+        raise NotImplementedError
+
+    def load_note(self, db: Session, lecture_note_id: int) -> tuple[np.ndarray, np.ndarray]:
+        """(chunk ids, L2-normalized float32 matrix) of a note's embedded chunks."""
+        raise NotImplementedError
+
+    def load_note_compact(self, db: Session, lecture_note_id: int) -> tuple[np.ndarray, CompactMatrix]:
+        """(chunk ids, CompactMatrix) of a note's embedded chunks, kept in the storage dtype."""
+        ids, matrix = self.load_note(db, lecture_note_id)
+        return ids, CompactMatrix(matrix)
+
+    def load_course(self, db: Session, course_id: int):
+        """(chunk ids, note ids, normalized matrix) over all notes of a course."""
+        note_ids = [n for (n,) in db.query(LectureNote.id).filter(LectureNote.course_id == course_id).order_by(LectureNote.id)]
+        parts = [(note_id, *self.load_note(db, note_id)) for note_id in note_ids]
+        parts = [p for p in parts if len(p[1])]
+        if not parts:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, np.zeros((0, 0), dtype=np.float32)
+        return (
+            np.concatenate([ids for _, ids, _ in parts]),
+            np.concatenate([np.full(len(ids), n, dtype=np.int64) for n, ids, _ in parts]),
+            np.concatenate([np.asarray(m) for _, _, m in parts]).astype(np.float32, copy=False),
+        )
+
+    def signature(self, db: Session, lecture_note_id: int) -> tuple:
+        """Cheap fingerprint that changes when a note's vectors change."""
+        raise NotImplementedError
+
+
+class MySQLBlobStore(VectorStore):
+    name = "mysql"
+
+    def contains(self, db, lecture_note_id, chunk_ids):
+        present = {
+            cid for (cid,) in db.query(Chunk.id).filter(Chunk.id.in_(chunk_ids), Chunk.embedding.isnot(None))
+        }
+        return np.array([cid in present for cid in chunk_ids], dtype=bool)
+
+    def _note_rows(self, db, lecture_note_id):
+        rows = (
+            db.query(Chunk.id, Chunk.embedding)
+            .filter(Chunk.lecture_notes_id == lecture_note_id, Chunk.embedding.isnot(None))
+            .order_by(Chunk.id)
+            .all()
+        )
+        rows = [row for row in rows if row.embedding]
+        return np.fromiter((row.id for row in rows), dtype=np.int64, count=len(rows)), rows
+
+    def load_note(self, db, lecture_note_id):
+        ids, rows = self._note_rows(db, lecture_note_id)
+        if not rows:
+            return ids, np.zeros((0, 0), dtype=np.float32)
+        return ids, np.ascontiguousarray(normalize_rows(decode_matrix([row.embedding for row in rows])))
+
+    def load_note_compact(self, db, lecture_note_id):
+        ids, rows = self._note_rows(db, lecture_note_id)
+        return ids, decode_compact([row.embedding for row in rows])
+
+    def load_course(self, db, course_id):
+        rows = (
+            db.query(Chunk.id, Chunk.lecture_notes_id, Chunk.embedding)
+            .join(LectureNote, LectureNote.id == Chunk.lecture_notes_id)
+            .filter(LectureNote.course_id == course_id, Chunk.embedding.isnot(None))
+            .order_by(Chunk.id)
+            .all()
+        )
+        rows = [row for row in rows if row.embedding]
+        ids = np.fromiter((r.id for r in rows), dtype=np.int64, count=len(rows))
+        note_ids = np.fromiter((r.lecture_notes_id for r in rows), dtype=np.int64, count=len(rows))
+        if not rows:
+            return ids, note_ids, np.zeros((0, 0), dtype=np.float32)
+        return ids, note_ids, normalize_rows(decode_matrix([r.embedding for r in rows])).astype(np.float32, copy=False)
+
+    def signature(self, db, lecture_note_id):
+        row = db.query(
+            func.count(Chunk.embedding), func.min(Chunk.id), func.max(Chunk.id)
+        ).filter(Chunk.lecture_notes_id == lecture_note_id).one()
+        return tuple(row)
+
+
+class MmapNpyStore(VectorStore):
+    name = "mmap"
+    external = True
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, lecture_note_id: int) -> str:
+        return os.path.join(self.root, f"note_{lecture_note_id}.npy")
+
+    def _lock(self, lecture_note_id: int):
+        """Cross-process lock for read-modify-write of a note's file."""
+        return file_lock(os.path.join(self.root, f"note_{lecture_note_id}.lock"))
+
+    def _open(self, lecture_note_id: int):
+        path = self._path(lecture_note_id)
+        if not os.path.exists(path):
+            return None
+        return np.load(path, mmap_mode="r")
+
+    def _write(self, lecture_note_id: int, ids: np.ndarray, vectors: np.ndarray):
+        path = self._path(lecture_note_id)
+        if len(ids) == 0:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        dim = vectors.shape[1]
+        records = np.empty(len(ids), dtype=[("id", "<i8"), ("vec", "<f4", (dim,))])
+        records["id"] = ids
+        records["vec"] = vectors
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, records)
+        # Readers holding the old mapping keep a valid view of the old file
+        os.replace(tmp_path, path)
+
+    def add(self, lecture_note_id, chunk_ids, vectors):
+        if len(chunk_ids) == 0:
+            return
+        chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+        vectors = normalize_rows(np.asarray(vectors, dtype=np.float32))
+        with self._lock(lecture_note_id):
+            current = self._open(lecture_note_id)
+            if current is not None and len(current):
+                keep = ~np.isin(current["id"], chunk_ids)
+                chunk_ids = np.concatenate((current["id"][keep], chunk_ids))
+                vectors = np.concatenate((current["vec"][keep], vectors))
+            self._write(lecture_note_id, chunk_ids, vectors)
+
+    def remove(self, lecture_note_id, chunk_ids=None):
+        with self._lock(lecture_note_id):
+            current = self._open(lecture_note_id)
+            if current is None:
+                return
+            if chunk_ids is None:
+                self._write(lecture_note_id, np.empty(0, np.int64), np.zeros((0, 0), np.float32))
+                return
+            keep = ~np.isin(current["id"], np.asarray(list(chunk_ids), dtype=np.int64))
+            self._write(lecture_note_id, current["id"][keep], current["vec"][keep])
+
+    def contains(self, db, lecture_note_id, chunk_ids):
+        ids, _ = self.load_note(db, lecture_note_id)
+        return np.isin(np.asarray(chunk_ids, dtype=np.int64), ids)
+
+    def load_note(self, db, lecture_note_id):
+        records = self._open(lecture_note_id)
+        if records is None:
+            # Notes embedded while the MySQL backend was active: migrate on first read
+            ids, matrix = MySQLBlobStore().load_note(db, lecture_note_id)
+            if len(ids):
+                with self._lock(lecture_note_id):
+                    if not os.path.exists(self._path(lecture_note_id)):
+                        self._write(lecture_note_id, ids, matrix)
+            return ids, matrix
+        # Zero-copy views into the shared mapping
+        return records["id"], records["vec"]
+
+    def signature(self, db, lecture_note_id):
+        try:
+            st = os.stat(self._path(lecture_note_id))
+            return (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return MySQLBlobStore().signature(db, lecture_note_id)
+
+
+_store: VectorStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_vector_store() -> VectorStore:
+    """The configured vector store (VECTOR_STORE)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if VECTOR_STORE == "mysql":
+                    _store = MySQLBlobStore()
+                elif VECTOR_STORE == "mmap":
+                    _store = MmapNpyStore(VECTOR_STORE_DIR)
+                else:
+                    raise ValueError(f"Unknown VECTOR_STORE: {VECTOR_STORE}")
+    return _store
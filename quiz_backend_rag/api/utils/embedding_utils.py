@@ -1,8 +1,43 @@
-from sentence_transformers import SentenceTransformer
+from api.config import EMBED_BATCH_SIZE, EMBEDDING_MODEL_NAME
 import numpy as np
+import threading
 
-# Load model once (cached)
-model = SentenceTransformer("all-MiniLM-L6-v2")
+# The model is loaded lazily on first use (importing sentence_transformers
+# alone pulls in torch), so CRUD-only workers and scripts never pay for it.
+_model = None
+_model_lock = threading.Lock()
+_model_error: str | None = None
+
+def get_model():
+    """Return the shared SentenceTransformer, loading it once (thread-safe)."""
+    global _model, _model_error
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    _model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+                    _model_error = None
+                except Exception as e:
+                    _model_error = str(e)
+                    raise
+    return _model
+
+def is_model_loaded() -> bool:
+    return _model is not None
+
+def model_load_error() -> str | None:
+    return _model_error
+
+def warm_up() -> None:
+    """Load the model and run one tiny encode so the first request is fast."""
+    get_model().encode("warm up")
+
+def start_warm_up() -> threading.Thread:
+    """Warm the model up in a background thread (used at API startup)."""
+    thread = threading.Thread(target=warm_up, name="embedding-warmup", daemon=True)
+    thread.start()
+    return thread
 
 def generate_embedding(text: str) -> bytes:
     """
@@ -12,5 +47,34 @@ def generate_embedding(text: str) -> bytes:
     if not text or text.strip() == "":
         return None
 
-    vector = model.encode(text)  # numpy float32 array
+    vector = get_model().encode(text)  # numpy float32 array
     return vector.tobytes()      # convert to binary for MySQL
+
+def encode_texts(texts: list[str], batch_size: int = EMBED_BATCH_SIZE) -> np.ndarray:
+    """Encode texts to a (len(texts), dim) float32 matrix."""
+    return get_model().encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+    ).astype(np.float32, copy=False)
+
+def get_tokenizer():
+    """Tokenizer of the embedding model (used for token-budget chunking)."""
+    return get_model().tokenizer
+
+_lowercases: bool | None = None
+
+def tokenizer_lowercases() -> bool:
+    """True if the embedding model's tokenizer lowercases its input (uncased model)."""
+    global _lowercases
+    if _lowercases is None:
+        tokenizer = get_tokenizer()
+        _lowercases = bool(
+            getattr(tokenizer, "do_lower_case", False)
+            or getattr(tokenizer, "init_kwargs", {}).get("do_lower_case", False)
+        )
+    return _lowercases
+
+def max_chunk_tokens() -> int:
+    """Wordpieces the encoder actually sees per text, excluding [CLS]/[SEP]."""
+    return get_model().max_seq_length - 2
@@ -0,0 +1,85 @@
+import re
+import numpy as np
+
+# Identifiers such as System.out.println or no-arg are kept as one term
+_TERM_RE = re.compile(r"[a-z_][a-z0-9_]*(?:[.\-][a-z0-9_]+)*")
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from further had
+has have having he her here hers herself him himself his how i if in into is it its itself just
+let me more most my myself no nor not now of off on once only or other our ours ourselves out over
+own same she should so some such than that the their theirs them themselves then there these they
+this those through to too under until up very was we were what when where which while who whom
+why will with would you your yours yourself yourselves may might must shall use used using one two
+""".split())
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased content terms of a text (stopwords and 1-2 char terms removed)."""
+    return [t for t in _TERM_RE.findall(text.lower()) if len(t) > 2 and t not in STOPWORDS]
+
+def tokenize_expanded(text: str) -> list[str]:
+    """
+    tokenize() plus the parts of compound identifiers, so a query for
+    println matches System.out.println (used by BM25).
+    """
+    terms = []
+    for term in _TERM_RE.findall(text.lower()):
+        parts = re.split(r"[.\-]", term) if ("." in term or "-" in term) else []
+        for t in [term, *parts]:
+            if len(t) > 2 and t not in STOPWORDS:
+                terms.append(t)
+    return terms
+
+def extract_keywords(texts: list[str], top_n: int = 8) -> list[list[str]]:
+    """
+    Top TF-IDF terms for each text, with IDF computed over all given texts
+    (the chunks of one lecture note).
+    Only tokenization is per text; counting, IDF, scoring and top-n
+    selection run on flat NumPy arrays for the whole note at once.
+    """
+    if not texts:
+        return []
+
+    vocab: dict[str, int] = {}
+    doc_ids = []
+    term_ids = []
+    for doc, text in enumerate(texts):
+        terms = tokenize(text)
+        term_ids.extend(vocab.setdefault(t, len(vocab)) for t in terms)
+        doc_ids.extend([doc] * len(terms))
+
+    if not term_ids:
+        return [[] for _ in texts]
+
+    n_docs = len(texts)
+    n_terms = len(vocab)
+    docs = np.asarray(doc_ids, dtype=np.int64)
+    terms = np.asarray(term_ids, dtype=np.int64)
+
+    # Term counts per (doc, term) pair, as a sparse COO triple
+    pairs, tf = np.unique(docs * n_terms + terms, return_counts=True)
+    pair_docs = pairs // n_terms
+    pair_terms = pairs % n_terms
+
+    # Smoothed IDF (same form as scikit-learn's default)
+    df = np.bincount(pair_terms, minlength=n_terms)
+    idf = np.log((1 + n_docs) / (1 + df)) + 1.0
+
+    doc_len = np.bincount(docs, minlength=n_docs)
+    scores = (tf / doc_len[pair_docs]) * idf[pair_terms]
+
+    # Sort by doc, then score desc; keep the first top_n entries of each doc
+    order = np.lexsort((-scores, pair_docs))
+    sorted_docs = pair_docs[order]
+    group_start = np.searchsorted(sorted_docs, sorted_docs, side="left")
+    rank = np.arange(len(order)) - group_start
+    keep = order[rank < top_n]
+
+    id_to_term = np.empty(n_terms, dtype=object)
+    id_to_term[list(vocab.values())] = list(vocab.keys())
+
+    keywords: list[list[str]] = [[] for _ in texts]
+    for doc, term in zip(pair_docs[keep].tolist(), id_to_term[pair_terms[keep]].tolist()):
+        keywords[doc].append(term)
+    return keywords
@@ -0,0 +1,10 @@
+from pypdf import PdfReader
+
+# Kept free of app imports: this module is what the spawned PDF extraction
+# workers (see ingest_service) import to run extract_page_range.
+
+def extract_page_range(file_path: str, start: int, end: int) -> list[str]:
+    """Extract text of pages [start, end). Runs inside a pool worker."""
+    reader = PdfReader(file_path)
+    # extract_text() can return None for image-only pages
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
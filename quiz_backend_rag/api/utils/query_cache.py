@@ -0,0 +1,160 @@
+from collections import OrderedDict
+from api.config import EMBEDDING_MODEL_NAME, QUERY_CACHE_SIZE, QUERY_CACHE_PATH
+from api.utils.embedding_utils import generate_embedding, encode_texts, tokenizer_lowercases
+import hashlib
+import sqlite3
+import threading
+
+# Cache of query embeddings (search topics repeat a lot).
+# Tier 1 is a bounded in-process LRU, tier 2 an optional sqlite file shared
+# across restarts and workers. Keys hash the normalized text and the model
+# name, so switching models never serves stale vectors.
+
+_lock = threading.Lock()
+_memory: OrderedDict[str, bytes] = OrderedDict()
+_disk: sqlite3.Connection | None = None
+_stats = {"hits": 0, "disk_hits": 0, "misses": 0}
+
+
+def normalize_query(text: str) -> str:
+    # Tokenizers ignore extra whitespace; case is folded only for uncased
+    # models (e.g. all-MiniLM-L6-v2), so the normalization never changes
+    # the embedding of the configured EMBEDDING_MODEL_NAME
+    text = " ".join(text.split())
+    return text.lower() if tokenizer_lowercases() else text
+
+
+def _cache_key(normalized: str) -> str:
+    return hashlib.sha256(f"{EMBEDDING_MODEL_NAME}\x00{normalized}".encode("utf-8")).hexdigest()
+
+
+def _get_disk() -> sqlite3.Connection | None:
+    global _disk
+    if not QUERY_CACHE_PATH:
+        return None
+    if _disk is None:
+        _disk = sqlite3.connect(QUERY_CACHE_PATH, check_same_thread=False)
+        _disk.execute("CREATE TABLE IF NOT EXISTS query_embeddings (key TEXT PRIMARY KEY, embedding BLOB NOT NULL)")
+        _disk.commit()
+    return _disk
+
+
+def _remember(key: str, emb: bytes):
+    _memory[key] = emb
+    _memory.move_to_end(key)
+    while len(_memory) > QUERY_CACHE_SIZE:
+        _memory.popitem(last=False)
+
+
+def _lookup(key: str) -> bytes | None:
+    """Memory then disk tier; caller holds _lock. Counts the hit or miss."""
+    emb = _memory.get(key)
+    if emb is not None:
+        _memory.move_to_end(key)
+        _stats["hits"] += 1
+        return emb
+
+    disk = _get_disk()
+    if disk is not None:
+        row = disk.execute("SELECT embedding FROM query_embeddings WHERE key = ?", (key,)).fetchone()
+        if row:
+            _stats["disk_hits"] += 1
+            _remember(key, row[0])
+            return row[0]
+    _stats["misses"] += 1
+    return None
+
+
+def _store(entries: list[tuple[str, bytes]]):
+    """Add encoded misses to both tiers; caller holds _lock."""
+    for key, emb in entries:
+        _remember(key, emb)
+    disk = _get_disk()
+    if disk is not None and entries:
+        disk.executemany("INSERT OR REPLACE INTO query_embeddings (key, embedding) VALUES (?, ?)", entries)
+        disk.commit()
+
+
+def embed_query(text: str) -> bytes | None:
+    """
+    Cached replacement for generate_embedding() on search queries.
+    Returns the float32 embedding bytes, or None for empty text.
+    """
+    if not text or text.strip() == "":
+        return None
+
+    normalized = normalize_query(text)
+    key = _cache_key(normalized)
+
+    with _lock:
+        emb = _lookup(key)
+        if emb is not None:
+            return emb
+
+    # Encode outside the lock so concurrent misses do not serialize
+    emb = generate_embedding(normalized)
+
+    with _lock:
+        _store([(key, emb)])
+    return emb
+
+
+def embed_queries(texts: list[str]) -> list[bytes | None]:
+    """
+    Cached embeddings of several queries, in input order (None for empty
+    text). All cache misses are encoded in a single encoder batch.
+    """
+    results: list[bytes | None] = [None] * len(texts)
+    missing: dict[str, list[int]] = {}  # normalized text -> positions
+
+    with _lock:
+        for i, text in enumerate(texts):
+            if not text or text.strip() == "":
+                continue
+            normalized = normalize_query(text)
+            if normalized in missing:
+                missing[normalized].append(i)
+                continue
+            emb = _lookup(_cache_key(normalized))
+            if emb is not None:
+                results[i] = emb
+            else:
+                missing[normalized] = [i]
+
+    if not missing:
+        return results
+
+    # Same bytes as generate_embedding(): raw float32
+    vectors = encode_texts(list(missing))
+    entries = []
+    for (normalized, positions), vec in zip(missing.items(), vectors):
+        emb = vec.tobytes()
+        entries.append((_cache_key(normalized), emb))
+        for i in positions:
+            results[i] = emb
+
+    with _lock:
+        _store(entries)
+    return results
+
+
+def cache_stats() -> dict:
+    with _lock:
+        lookups = _stats["hits"] + _stats["disk_hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "lookups": lookups,
+            "hit_rate": round((_stats["hits"] + _stats["disk_hits"]) / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(_memory),
+            "memory_capacity": QUERY_CACHE_SIZE,
+            "disk_enabled": bool(QUERY_CACHE_PATH),
+            "model": EMBEDDING_MODEL_NAME,
+        }
+
+
+def clear_cache():
+    """Drop the in-memory tier and reset counters (the disk tier is kept)."""
+    with _lock:
+        _memory.clear()
+        for k in _stats:
+            _stats[k] = 0
@@ -0,0 +1,170 @@
+import struct
+import numpy as np
+
+# Binary formats for Chunk.embedding.
+#
+# Legacy: raw float32 bytes (vector.tobytes()), no header.
+# Compact: 8-byte header + optional scale + payload
+#   magic b"QV" | version (u8) | dtype code (u8) | dim (u32, little endian)
+#   int8 vectors are followed by a float32 scale, then the int8 payload;
+#   float16/float32 vectors are followed directly by the payload.
+
+MAGIC = b"QV"
+VERSION = 1
+HEADER = struct.Struct("<2sBBI")
+SCALE = struct.Struct("<f")
+
+DTYPE_CODES = {"float32": 0, "float16": 1, "int8": 2}
+CODE_DTYPES = {code: name for name, code in DTYPE_CODES.items()}
+
+
+def encode_vector(vector: np.ndarray, dtype: str = "float32") -> bytes:
+    """
+    Serialize an embedding for storage.
+    float32 keeps the legacy raw layout; float16 and int8 get a header.
+    int8 uses symmetric per-vector quantization: v ~= q * scale.
+    """
+    if dtype not in DTYPE_CODES:
+        raise ValueError(f"Unsupported embedding dtype: {dtype}")
+
+    vec = np.asarray(vector, dtype=np.float32).ravel()
+    if dtype == "float32":
+        return vec.tobytes()
+
+    header = HEADER.pack(MAGIC, VERSION, DTYPE_CODES[dtype], vec.size)
+    if dtype == "float16":
+        return header + vec.astype(np.float16).tobytes()
+
+    max_abs = float(np.max(np.abs(vec))) if vec.size else 0.0
+    scale = max_abs / 127.0 if max_abs > 0 else 1.0
+    quantized = np.clip(np.rint(vec / scale), -127, 127).astype(np.int8)
+    return header + SCALE.pack(scale) + quantized.tobytes()
+
+
+def _parse(blob: bytes):
+    """Return (dtype name, dim, scale, payload offset) for a blob."""
+    if len(blob) >= HEADER.size and blob[:2] == MAGIC:
+        magic, version, code, dim = HEADER.unpack_from(blob)
+        dtype = CODE_DTYPES.get(code)
+        if version == VERSION and dtype is not None:
+            offset = HEADER.size
+            scale = 1.0
+            if dtype == "int8":
+                (scale,) = SCALE.unpack_from(blob, offset)
+                offset += SCALE.size
+            # Guard against a legacy float32 blob that happens to start with the magic
+            if len(blob) - offset == dim * np.dtype(dtype).itemsize:
+                return dtype, dim, scale, offset
+    return "float32", len(blob) // 4, 1.0, 0
+
+
+def blob_dtype(blob: bytes) -> str:
+    return _parse(blob)[0] if blob else "float32"
+
+
+def decode_vector(blob: bytes) -> np.ndarray:
+    """Decode any stored embedding (legacy or compact) to a float32 vector."""
+    if not blob:
+        return np.array([], dtype=np.float32)
+    dtype, dim, scale, offset = _parse(blob)
+    vec = np.frombuffer(blob, dtype=dtype, count=dim, offset=offset)
+    if dtype == "float32":
+        return vec
+    vec = vec.astype(np.float32)
+    if dtype == "int8":
+        vec *= scale
+    return vec
+
+
+def decode_matrix(blobs: list[bytes]) -> np.ndarray:
+    """
+    Decode many stored embeddings into one contiguous (n, dim) float32 matrix.
+    Legacy raw float32 blobs of equal size are decoded with a single
+    frombuffer over their concatenation.
+    """
+    if not blobs:
+        return np.empty((0, 0), dtype=np.float32)
+
+    first_len = len(blobs[0])
+    if all(len(b) == first_len and _parse(b)[0] == "float32" for b in blobs):
+        return np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(len(blobs), first_len // 4)
+
+    return np.ascontiguousarray(np.vstack([decode_vector(b) for b in blobs]), dtype=np.float32)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize rows; all-zero rows stay zero (cosine 0, as before)."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+# Rows cast to float32 at a time when scoring a compact matrix
+SCORE_BLOCK_ROWS = 4096
+
+
+class CompactMatrix:
+    """
+    A note's stored embeddings kept in their storage dtype (float32,
+    float16 or int8). Row i is the L2-normalized vector data[i] * scales[i];
+    scales is None when the rows are already normalized float32.
+    Scoring casts one block of rows to float32 at a time, so the float32
+    copy of a whole note is never materialized.
+    """
+
+    def __init__(self, data: np.ndarray, scales: np.ndarray | None = None):
+        self.data = data
+        self.scales = scales
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def scores(self, queries: np.ndarray, rows: np.ndarray | None = None) -> np.ndarray:
+        """
+        Cosines of normalized queries (m, dim) against every row, as (m, n),
+        or only against the given row positions, as (m, len(rows)).
+        """
+        data = self.data if rows is None else self.data[rows]
+        scales = self.scales if rows is None or self.scales is None else self.scales[rows]
+        if scales is None:
+            return queries @ data.T
+        out = np.empty((len(queries), len(data)), dtype=np.float32)
+        for start in range(0, len(data), SCORE_BLOCK_ROWS):
+            block = data[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+            out[:, start:start + len(block)] = queries @ block.T
+        out *= scales
+        return out
+
+
+def decode_compact(blobs: list[bytes]) -> CompactMatrix:
+    """
+    Stack stored embeddings into a CompactMatrix without widening them.
+    Notes whose blobs are float32 or of mixed formats/dims are decoded to
+    a normalized float32 matrix instead.
+    """
+    if not blobs:
+        return CompactMatrix(np.zeros((0, 0), dtype=np.float32))
+
+    parsed = [_parse(b) for b in blobs]
+    dtype, dim = parsed[0][0], parsed[0][1]
+    if dtype == "float32" or any(p[0] != dtype or p[1] != dim for p in parsed):
+        return CompactMatrix(np.ascontiguousarray(normalize_rows(decode_matrix(blobs)), dtype=np.float32))
+
+    data = np.frombuffer(
+        b"".join(blob[offset:] for blob, (_, _, _, offset) in zip(blobs, parsed)), dtype=dtype
+    ).reshape(len(blobs), dim)
+    scales = np.fromiter((scale for _, _, scale, _ in parsed), dtype=np.float32, count=len(parsed))
+
+    # Fold the L2 norm of each decoded row into its scale
+    norms = np.empty(len(data), dtype=np.float32)
+    for start in range(0, len(data), SCORE_BLOCK_ROWS):
+        norms[start:start + SCORE_BLOCK_ROWS] = np.linalg.norm(
+            data[start:start + SCORE_BLOCK_ROWS].astype(np.float32), axis=1
+        )
+    norms *= scales
+    norms[norms == 0] = 1.0  # all-zero rows stay zero
+    return CompactMatrix(data, scales / norms)
@@ -0,0 +1,41 @@
+import sys
+import os
+import argparse
+
+# Add api directory to path so imports work
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+from api.database import SessionLocal
+from api.models.retrieval_records import RetrievalRecord # Needed for relationship resolution
+from api.models.quizzes import Quiz
+from api.services.backfill_service import backfill_embeddings
+from api.config import BACKFILL_BATCH_SIZE
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed chunks that were stored without an embedding.")
+    parser.add_argument("--course-id", type=int, default=None, help="Only backfill notes of this course")
+    parser.add_argument("--after-id", type=int, default=0, help="Resume after this chunk id")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    args = parser.parse_args()
+
+    def report(progress: dict):
+        print(f"Embedded {progress['embedded']} chunks so far (resume with --after-id {progress['last_id']})")
+
+    db = SessionLocal()
+    try:
+        # One call for the whole run: course ANN indexes are refreshed once at the end
+        result = backfill_embeddings(
+            db,
+            course_id=args.course_id,
+            after_id=args.after_id,
+            batch_size=args.batch_size,
+            on_batch=report,
+        )
+    finally:
+        db.close()
+
+    print(f"Done. Embedded {result['embedded']} chunks.")
+
+if __name__ == "__main__":
+    main()
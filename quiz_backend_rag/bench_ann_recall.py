@@ -0,0 +1,74 @@
+import sys
+import os
+import time
+import argparse
+import numpy as np
+
+# Add api directory to path so imports work
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+from api.services.ann_index import IVFIndex
+from api.utils.vector_codec import normalize_rows
+
+def synthetic_index(n: int, dim: int, clusters: int, seed: int = 0):
+    """Clustered unit vectors, roughly shaped like sentence embeddings of many notes."""
+    rng = np.random.default_rng(seed)
+    centers = normalize_rows(rng.standard_normal((clusters, dim)).astype(np.float32))
+    vectors = centers[rng.integers(0, clusters, n)] + 0.08 * rng.standard_normal((n, dim)).astype(np.float32)
+    vectors = normalize_rows(vectors).astype(np.float32)
+    ids = np.arange(n, dtype=np.int64)
+    t0 = time.perf_counter()
+    index = IVFIndex.build(ids, ids // 500, vectors)
+    print(f"Built IVF index: {n} vectors, {len(index.centroids)} lists in {time.perf_counter() - t0:.1f}s")
+    queries = centers[rng.integers(0, clusters, 200)] + 0.08 * rng.standard_normal((200, dim)).astype(np.float32)
+    return index, normalize_rows(queries).astype(np.float32)
+
+def course_index(course_id: int):
+    from api.database import SessionLocal
+    from api.models.retrieval_records import RetrievalRecord # Needed for relationship resolution
+    from api.models.quizzes import Quiz
+    from api.services.ann_index import build_course_index
+
+    db = SessionLocal()
+    try:
+        t0 = time.perf_counter()
+        index = build_course_index(db, course_id)
+        print(f"Built course {course_id} index: {index.size} vectors, "
+              f"{len(index.centroids)} lists in {time.perf_counter() - t0:.1f}s")
+    finally:
+        db.close()
+    # Use stored chunk vectors (slightly perturbed) as queries
+    rng = np.random.default_rng(0)
+    sample = index.vectors[rng.choice(index.size, min(200, index.size), replace=False)]
+    queries = sample + 0.05 * rng.standard_normal(sample.shape).astype(np.float32)
+    return index, normalize_rows(queries).astype(np.float32)
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k and latency of IVF course search vs exact search.")
+    parser.add_argument("--course-id", type=int, default=None, help="Benchmark a real course (needs DB)")
+    parser.add_argument("--n", type=int, default=200_000, help="Synthetic vectors when no course is given")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    if args.course_id is not None:
+        index, queries = course_index(args.course_id)
+    else:
+        index, queries = synthetic_index(args.n, args.dim, clusters=max(10, args.n // 1000))
+
+    t0 = time.perf_counter()
+    truth = [set(index.search_exact(q, args.k)[0].tolist()) for q in queries]
+    exact_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+    print(f"exact      : recall@{args.k}=1.000  {exact_ms:.2f} ms/query")
+
+    for nprobe in args.nprobe:
+        t0 = time.perf_counter()
+        found = [index.search(q, args.k, nprobe)[0] for q in queries]
+        ann_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+        recall = np.mean([len(truth[i].intersection(f.tolist())) / max(1, len(truth[i])) for i, f in enumerate(found)])
+        print(f"nprobe={nprobe:<4}: recall@{args.k}={recall:.3f}  {ann_ms:.2f} ms/query")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import sys
+import os
+import time
+import argparse
+
+# Add api directory to path so imports work
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+from api.services import ingest_service
+from api.utils import embedding_utils
+from api.config import EMBED_BATCH_SIZE
+
+SAMPLE_TEXT = """
+A constructor with no arguments is known as a no-arg constructor. The signature is the same as
+the default constructor; however the body can have any code, unlike the default constructor where
+the body of the constructor is empty. Even if you write public Student(){} in your class Student it
+cannot be called a default constructor since you have written the code of it.
+Method overloading lets a class define several methods with the same name but different parameter
+lists. The compiler picks the method whose parameters best match the arguments of the call.
+"""
+
+def load_chunks(pdf_path: str | None, repeat: int) -> list[str]:
+    if pdf_path:
+        pages = (ingest_service.clean_text(p) for p in ingest_service.iter_pdf_pages(pdf_path))
+        return list(ingest_service.iter_chunks(pages))
+    return list(ingest_service.iter_chunks(ingest_service.clean_text(SAMPLE_TEXT * repeat)))
+
+def chunks_per_sec(chunks: list[str], batch_size: int) -> float:
+    """Encode every chunk batch_size at a time (1 = the old one encode call per chunk)."""
+    t0 = time.perf_counter()
+    for start in range(0, len(chunks), batch_size):
+        embedding_utils.encode_texts(chunks[start:start + batch_size], batch_size=batch_size)
+    elapsed = time.perf_counter() - t0
+    return len(chunks) / elapsed if elapsed else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunk embedding throughput: one encode per chunk vs batched")
+    parser.add_argument("--pdf", help="Chunk this PDF (default: a repeated built-in sample)")
+    parser.add_argument("--repeat", type=int, default=200, help="Copies of the sample text")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.pdf, args.repeat)
+    if not chunks:
+        print("No chunks to embed.")
+        return
+
+    embedding_utils.warm_up()  # load the model outside the timings
+    before = chunks_per_sec(chunks, 1)
+    after = chunks_per_sec(chunks, args.batch_size)
+    print(f"{len(chunks)} chunks")
+    print(f"one encode per chunk: {before:.1f} chunks/s")
+    print(f"batch size {args.batch_size}: {after:.1f} chunks/s ({after / before:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import sys
+import os
+import json
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# Add api directory to path so imports work
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+SAMPLE_CHUNKS = [
+    "A constructor with no arguments is known as a no-arg constructor. Its body can contain any code, "
+    "unlike the default constructor, which the compiler generates with an empty body.",
+    "Method overloading lets a class define several methods with the same name but different parameter "
+    "lists. The compiler picks the method whose parameters best match the arguments of the call.",
+    "An abstract class cannot be instantiated. It may declare abstract methods that concrete subclasses "
+    "must implement, and it can also provide fields and fully implemented methods.",
+    "Interfaces declare methods that implementing classes must provide. A class can implement several "
+    "interfaces, which is how Java supports multiple inheritance of type.",
+]
+
+def worker(questions: int, count: int, difficulty: str):
+    """Runs in a child process configured through LLM_* env vars; prints one JSON line."""
+    from api.services import mcq_generator
+
+    pool = mcq_generator.get_model_pool()
+    t0 = time.perf_counter()
+    pool.load_all()
+    load_secs = time.perf_counter() - t0
+
+    calls = -(-questions // count)
+    # One submitting thread per instance, like the LLM executor with LLM_WORKERS = LLM_INSTANCES
+    with ThreadPoolExecutor(max_workers=len(pool.instances)) as ex:
+        t0 = time.perf_counter()
+        results = list(ex.map(
+            lambda i: mcq_generator.generate_mcqs_phi3(SAMPLE_CHUNKS[i % len(SAMPLE_CHUNKS)], difficulty, count=count),
+            range(calls),
+        ))
+        elapsed = time.perf_counter() - t0
+
+    produced = sum(len(r) for r in results)
+    print(json.dumps({
+        "instances": len(pool.instances),
+        "threads_per_instance": len(pool.instances[0].cores),
+        "load_secs": round(load_secs, 1),
+        "calls": calls,
+        "questions": produced,
+        "secs": round(elapsed, 1),
+        "questions_per_min": round(produced / elapsed * 60, 1) if elapsed else 0.0,
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate MCQ throughput of 1 vs N Phi-3 instances")
+    parser.add_argument("--instances", type=int, nargs="+", default=[1, 4],
+                        help="Pool sizes to compare (default: 1 4)")
+    parser.add_argument("--questions", type=int, default=24, help="MCQs to generate per run")
+    parser.add_argument("--count", type=int, default=1, help="MCQs per model call")
+    parser.add_argument("--difficulty", default="Medium")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.questions, args.count, args.difficulty)
+        return
+
+    print(f"Cores available: {len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()}")
+    # Each pool size runs in a fresh process so instances and KV caches are freed in between
+    for n in args.instances:
+        env = {**os.environ, "LLM_INSTANCES": str(n), "LLM_THREADS_PER_INSTANCE": "0"}
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker",
+             "--questions", str(args.questions), "--count", str(args.count), "--difficulty", args.difficulty],
+            env=env, capture_output=True, text=True,
+        )
+        lines = [l for l in out.stdout.splitlines() if l.startswith("{")]
+        if out.returncode != 0 or not lines:
+            print(f"instances={n}: failed\n{out.stderr.strip()[-2000:]}")
+            continue
+        r = json.loads(lines[-1])
+        print(f"instances={r['instances']:<2} threads/instance={r['threads_per_instance']:<3} "
+              f"{r['questions']} MCQs in {r['secs']}s -> {r['questions_per_min']} questions/min "
+              f"(load {r['load_secs']}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import sys
+import os
+import time
+import argparse
+
+# Add api directory to path so imports work
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+from api.services import mcq_generator
+
+SAMPLE_CHUNK = """
+A constructor with no arguments is known as a no-arg constructor. The signature is the same as
+the default constructor; however the body can have any code, unlike the default constructor where
+the body of the constructor is empty. Even if you write public Student(){} in your class Student it
+cannot be called a default constructor since you have written the code of it.
+"""
+
+def load_chunks(lecture_note_id: int, limit: int) -> list[str]:
+    from api.database import SessionLocal
+    from api.models.retrieval_records import RetrievalRecord # Needed for relationship resolution
+    from api.models.quizzes import Quiz
+    from api.models.chunks import Chunk
+
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(Chunk.text)
+            .filter(Chunk.lecture_notes_id == lecture_note_id)
+            .order_by(Chunk.chunk_index)
+            .limit(limit)
+            .all()
+        )
+        return [row.text for row in rows]
+    finally:
+        db.close()
+
+def run(chunks: list[str], calls: int, count: int, difficulty: str) -> dict:
+    """Generates `calls` times round-robin over chunks and returns the counters."""
+    before = mcq_generator.generation_stats()
+    t0 = time.perf_counter()
+    for i in range(calls):
+        mcq_generator.generate_mcqs_phi3(chunks[i % len(chunks)], difficulty, count=count)
+    elapsed = time.perf_counter() - t0
+    after = mcq_generator.generation_stats()
+
+    delta = {k: after[k] - before[k] for k in ("calls", "json_valid", "mcqs_requested", "mcqs_valid")}
+    delta["json_valid_rate"] = delta["json_valid"] / delta["calls"] if delta["calls"] else 0.0
+    delta["mcq_valid_rate"] = delta["mcqs_valid"] / delta["mcqs_requested"] if delta["mcqs_requested"] else 0.0
+    delta["secs"] = elapsed
+    return delta
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON validity of Phi-3 MCQ output with and without the GBNF grammar")
+    parser.add_argument("--lecture-note-id", type=int, help="Use this note's chunks (default: a built-in sample)")
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--count", type=int, default=1, help="MCQs per call")
+    parser.add_argument("--difficulty", default="Medium")
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.lecture_note_id, 5) if args.lecture_note_id else [SAMPLE_CHUNK]
+    if not chunks:
+        print("No chunks found for this lecture note.")
+        return
+
+    mcq_generator.get_model_pool().load_all()  # load every instance outside the timings
+    for grammar in (False, True):
+        mcq_generator.MCQ_GRAMMAR = grammar
+        r = run(chunks, args.calls, args.count, args.difficulty)
+        print(f"grammar={'on ' if grammar else 'off'}  calls={r['calls']}  "
+              f"json valid {r['json_valid_rate']:.0%}  mcqs valid {r['mcqs_valid']}/{r['mcqs_requested']} "
+              f"({r['mcq_valid_rate']:.0%})  {r['secs']:.1f}s "
+              f"({r['mcqs_valid'] / r['secs'] * 60:.1f} valid MCQs/min)")
+
+if __name__ == "__main__":
+    main()